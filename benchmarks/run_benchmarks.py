@@ -0,0 +1,287 @@
+import os
+import sys
+import git
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from datetime import datetime
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ['segmentation', 'smoothness', 'preprocessing']:
+    sys.path.append(os.path.join(repo_dir, folder))
+from linear_segmentation import LinearSegmentation
+from segment_all_files import segment_total
+from summarize_segments import summarize
+from synthetic_traces import synthetic_session
+from smoothness_metrics import sparc, ldj, SegmentMetric
+
+"""
+Benchmarks the segmentation, smoothness and preprocessing hot paths on synthetic sessions from 1 minute to 2 hours
+long at 90 and 120 Hz. Throughput (samples per second) and peak memory are measured for each benchmark and session
+length, and saved to outputs/benchmarks/<commit>.json so that runs on different commits can be compared with
+--compare.
+"""
+
+def _session(n: int, fs: float, gaps: bool = True):
+    """Synthetic speed session of n samples, with tracking gaps and spikes, as the input to every benchmark.
+    """
+    return synthetic_session(minutes=n/fs/60, fs=fs, seed=0, gaps_per_minute=0.2 if gaps else 0)[0]
+
+def _segmented_session(n: int, fs: float, engine: str):
+    df = _session(n, fs)
+    return_dict = segment_total(df['timeExp'], df['speed'], sig_level=10**(-4), window_size=10, return_models=True,
+                                engine=engine)
+    return df, return_dict
+
+def bench_segment(n: int, fs: float, engine: str):
+    """LinearSegmentation.segment on one section without gaps."""
+    df = _session(n, fs, gaps=False)
+    segmentation = LinearSegmentation(engine)
+    return lambda: segmentation.segment(df['timeExp'], df['speed'], window_size=10, sig_level=10**(-4),
+                                        return_models=True)
+
+def bench_segment_total(n: int, fs: float, engine: str):
+    """segment_total on a session with tracking gaps."""
+    df = _session(n, fs)
+    return lambda: segment_total(df['timeExp'], df['speed'], sig_level=10**(-4), window_size=10, return_models=True,
+                                 engine=engine)
+
+def bench_summarize(n: int, fs: float, engine: str):
+    """summarize of a segmented session, including writing the summary file."""
+    df, return_dict = _segmented_session(n, fs, engine)
+    os.makedirs(os.path.join(repo_dir, 'outputs', 'adl_summarize'), exist_ok=True)
+    return lambda: summarize(df, return_dict['breakpoints'], 'speed', return_dict['model_results'],
+                             'summarize_benchmark.csv')
+
+def bench_sparc(n: int, fs: float, engine: str):
+    """sparc of a whole session."""
+    speed = _session(n, fs)['speed'].to_numpy()
+    return lambda: sparc(speed, fs)
+
+def bench_segment_sparc(n: int, fs: float, engine: str):
+    """SegmentMetric(sparc).value over the segments of a session."""
+    df, return_dict = _segmented_session(n, fs, engine)
+    return lambda: SegmentMetric(sparc).value(df['speed'], fs, return_dict['breakpoints'])
+
+def bench_segment_ldj(n: int, fs: float, engine: str):
+    """SegmentMetric(ldj).value on jerk over the segments of a session."""
+    df, return_dict = _segmented_session(n, fs, engine)
+    jerk = df['speed'].diff().diff().fillna(0)*fs*fs
+    return lambda: SegmentMetric(ldj).value(jerk, fs, return_dict['breakpoints'], data_type='jerk',
+                                            speed=df['speed'])
+
+def bench_clean_outliers(n: int, fs: float, engine: str):
+    """clean_outliers (Hampel filter per section) of a session."""
+    from preprocess_segmentation import clean_outliers
+    df = _session(n, fs)
+    return lambda: clean_outliers(df['timeExp'], df['speed'])
+
+def bench_preprocess(n: int, fs: float, engine: str):
+    """preprocess_segmentation.preprocess of one raw session, run in a temporary repository."""
+    from preprocess_segmentation import preprocess
+    tmp_dir = tempfile.mkdtemp()
+    git.Repo.init(tmp_dir)
+    for folder in ['raw', 'processed', 'metadata']:
+        os.makedirs(os.path.join(tmp_dir, 'raw_data', folder))
+    for object_name in ['head', 'controller']:
+        for variable in ['dist', 'speed', 'accel']:
+            os.makedirs(os.path.join(tmp_dir, 'input_data', object_name, variable))
+    os.makedirs(os.path.join(tmp_dir, 'input_data', 'raw'))
+    with open(os.path.join(tmp_dir, 'raw_data', 'metadata', 'runs.txt'), 'w') as runs_file:
+        runs_file.write('0')
+    # Positions as random walks with the speed of the synthetic session
+    rng = np.random.default_rng(0)
+    df = _session(n, fs)
+    raw = pd.DataFrame({'frame': np.arange(n), 'sub': 1, 'subID': 1, 'timepoint': 1, 'session': 1,
+                        'timeExp': df['timeExp']})
+    for object_name in ['head', 'controller']:
+        direction = rng.normal(size=(n, 3))
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        positions = np.cumsum(direction*df['speed'].to_numpy()[:, None]/fs, axis=0)
+        for axis, values in zip('xyz', positions.T):
+            raw[f'{object_name}_{axis}'] = values
+    raw.to_csv(os.path.join(tmp_dir, 'raw_data', 'raw', 'benchmark.csv'), index=False)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            preprocess(['benchmark.csv'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp_dir)
+    return run
+
+# Benchmark name -> function(n, fs, engine) that prepares the inputs and returns the call to time
+benchmarks = {'segment': bench_segment,
+              'segment_total': bench_segment_total,
+              'summarize': bench_summarize,
+              'sparc': bench_sparc,
+              'segment_sparc': bench_segment_sparc,
+              'segment_ldj': bench_segment_ldj,
+              'clean_outliers': bench_clean_outliers,
+              'preprocess': bench_preprocess}
+
+def run_benchmark(name: str,
+                  minutes: float,
+                  fs: float,
+                  engine: str = 'incremental',
+                  repeat: int = 3):
+    """Time a benchmark and measure its peak memory.
+
+    The inputs are prepared again before every run and are not timed. Peak memory is measured with tracemalloc in a
+    separate run, so it does not slow down the timed runs.
+
+    Args:
+        name (str): Key of benchmarks.
+        minutes (float): Session length in minutes.
+        fs (float): Sampling frequency.
+        engine (str, optional): LinearSegmentation engine used by the segmentation benchmarks. Defaults to
+        'incremental'.
+        repeat (int, optional): Number of timed runs. Defaults to 3.
+    Returns:
+        dict: Benchmark, session length, median and minimum seconds, samples per second and peak memory in MB.
+    """
+    n = int(minutes*60*fs)
+    seconds = []
+    for _ in range(repeat):
+        run = benchmarks[name](n, fs, engine)
+        start = perf_counter()
+        run()
+        seconds.append(perf_counter() - start)
+
+    run = benchmarks[name](n, fs, engine)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'benchmark': name, 'engine': engine, 'fs': fs, 'minutes': minutes, 'samples': n,
+            'seconds': float(np.median(seconds)), 'min_seconds': min(seconds),
+            'samples_per_second': n/float(np.median(seconds)), 'peak_memory_mb': peak/2**20}
+
+def run_benchmarks(names: list,
+                   durations: list = [1, 5, 15, 30, 60, 120],
+                   sampling_rates: list = [90, 120],
+                   engine: str = 'incremental',
+                   repeat: int = 3,
+                   max_seconds: float = None):
+    """Run benchmarks over every session length and sampling frequency.
+
+    Args:
+        names (list of str): Benchmarks to run, keys of benchmarks.
+        durations (list of float, optional): Session lengths in minutes. Defaults to [1, 5, 15, 30, 60, 120].
+        sampling_rates (list of float, optional): Sampling frequencies. Defaults to [90, 120].
+        engine (str, optional): LinearSegmentation engine used by the segmentation benchmarks. Defaults to
+        'incremental'.
+        repeat (int, optional): Number of timed runs of each case. Defaults to 3.
+        max_seconds (float, optional): Skip longer sessions of a benchmark once a run takes longer than this.
+        Defaults to None.
+    Returns:
+        list of dict: Results of run_benchmark, with an 'error' entry for benchmarks that failed.
+    """
+    results = []
+    for name in names:
+        for fs in sampling_rates:
+            for minutes in sorted(durations):
+                try:
+                    result = run_benchmark(name, minutes, fs, engine, repeat)
+                except Exception as error:
+                    print(f'{name} {minutes} min {fs} Hz failed: {error!r}')
+                    results.append({'benchmark': name, 'engine': engine, 'fs': fs, 'minutes': minutes,
+                                    'error': repr(error)})
+                    break
+                print(f'{name} {minutes} min {fs} Hz: {result["seconds"]:.3f} seconds, '
+                      f'{result["samples_per_second"]:.0f} samples/s, {result["peak_memory_mb"]:.1f} MB')
+                results.append(result)
+                if max_seconds is not None and result['seconds'] > max_seconds:
+                    break
+    return results
+
+def save_results(results: list, repo: git.Repo):
+    """Save results to outputs/benchmarks/<commit>.json, with '-dirty' added if the tree has uncommitted changes.
+
+    Returns:
+        str: Path of the saved file.
+    """
+    commit = repo.head.commit.hexsha[:10]
+    dirty = repo.is_dirty()
+    save_path = os.path.join(repo.working_tree_dir, 'outputs', 'benchmarks')
+    os.makedirs(save_path, exist_ok=True)
+    file_path = os.path.join(save_path, f'{commit}{"-dirty" if dirty else ""}.json')
+    with open(file_path, 'w') as results_file:
+        json.dump({'commit': commit, 'dirty': dirty, 'date': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                   'machine': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+                   'results': results}, results_file, indent=1)
+    return file_path
+
+def load_results(file_path: str):
+    """Results saved by save_results.
+    """
+    with open(file_path) as results_file:
+        return json.load(results_file)['results']
+
+def compare_results(results: list, reference: list, threshold: float = 1.2):
+    """Compare results with a saved run, matching benchmark, engine, sampling frequency and session length.
+
+    Args:
+        results (list of dict): Results of run_benchmarks.
+        reference (list of dict): Results of the run to compare against, e.g. from load_results.
+        threshold (float, optional): Ratio of seconds above which a case is flagged as a regression. Defaults to 1.2.
+    Returns:
+        pd.DataFrame: One row per case in both runs with the ratio of seconds and of peak memory to the reference.
+    """
+    keys = ['benchmark', 'engine', 'fs', 'minutes']
+    current = pd.DataFrame([result for result in results if 'error' not in result])
+    reference = pd.DataFrame([result for result in reference if 'error' not in result])
+    comparison = current.merge(reference, on=keys, suffixes=('', '_reference'))
+    comparison['time_ratio'] = comparison['seconds']/comparison['seconds_reference']
+    comparison['memory_ratio'] = comparison['peak_memory_mb']/comparison['peak_memory_mb_reference']
+    comparison['regression'] = comparison['time_ratio'] > threshold
+    return comparison[keys + ['seconds_reference', 'seconds', 'time_ratio', 'peak_memory_mb_reference',
+                              'peak_memory_mb', 'memory_ratio', 'regression']]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the segmentation, smoothness and preprocessing code.')
+    parser.add_argument('benchmarks', nargs='*', default=list(benchmarks),
+                        help=f'Benchmarks to run, from {", ".join(benchmarks)}. Defaults to all.')
+    parser.add_argument('--minutes', nargs='+', type=float, default=[1, 5, 15, 30, 60, 120],
+                        help='Session lengths in minutes.')
+    parser.add_argument('--fs', nargs='+', type=float, default=[90, 120], help='Sampling frequencies.')
+    parser.add_argument('--engine', default='incremental')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='Skip longer sessions of a benchmark once a run takes longer than this.')
+    parser.add_argument('--compare', default=None,
+                        help='Commit, or path of a results file, to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Ratio of seconds above which a case is reported as a regression.')
+    args = parser.parse_args()
+
+    repo = git.Repo('.', search_parent_directories=True)
+
+    # Load the reference first, as it is overwritten if it is the results file of the current commit
+    if args.compare is not None:
+        reference_file = args.compare
+        if not os.path.exists(reference_file):
+            reference_file = os.path.join(repo.working_tree_dir, 'outputs', 'benchmarks',
+                                          f'{repo.commit(args.compare).hexsha[:10]}.json')
+        reference = load_results(reference_file)
+
+    results = run_benchmarks(args.benchmarks, args.minutes, args.fs, args.engine, args.repeat, args.max_seconds)
+    print('Results saved to', save_results(results, repo))
+
+    if args.compare is not None:
+        comparison = compare_results(results, reference, args.threshold)
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+            print(comparison)
+        print(f'{comparison["regression"].sum()} of {len(comparison)} cases slower by more than {args.threshold}x')
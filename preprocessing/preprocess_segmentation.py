@@ -6,6 +6,9 @@ import numpy as np
 from hampel import hampel
 import json
 import time
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'segmentation'))
+from instrumentation import configure, span, file_span
 
 def clean_outliers(time: pd.Series,
                     y: pd.Series,
@@ -51,92 +54,107 @@ def preprocess(files: list = None,
         files = os.listdir(raw_file_path)
 
     for file in files:
-        temp_start = time.time()
-        df = pd.read_csv(os.path.join(raw_file_path, file))
+        with file_span(file) as total:
+            with span('load') as record:
+                df = pd.read_csv(os.path.join(raw_file_path, file))
+                record['rows'] = len(df)
 
-        rename_dict = {}
-        for col in df.columns:
-            rename_dict[col] = col.replace(' ', '')
+            rename_dict = {}
+            for col in df.columns:
+                rename_dict[col] = col.replace(' ', '')
 
-        df=df.rename(columns=rename_dict)
+            df=df.rename(columns=rename_dict)
 
-        sub = str(df['sub'][0])
-        session = str(df['session'][0])
-        time_point = str(df['timepoint'][0])
-        file_name = f'{sub}_{time_point}_{session}.csv'
+            sub = str(df['sub'][0])
+            session = str(df['session'][0])
+            time_point = str(df['timepoint'][0])
+            file_name = f'{sub}_{time_point}_{session}.csv'
 
-        file_names.append(file_name)
+            file_names.append(file_name)
 
-        df = df.drop(columns=['frame', 'sub', 'subID', 'timepoint', 'session'])
-        df.to_csv(os.path.join(save_path, 'raw', file_name), index = False)
+            df = df.drop(columns=['frame', 'sub', 'subID', 'timepoint', 'session'])
+            # Cleaning and writing are interleaved, so each writes several records, summed into the total record
+            timings = {}
+            with span('write', timings=timings):
+                df.to_csv(os.path.join(save_path, 'raw', file_name), index = False)
 
-        df = df[['timeExp','head_x','head_y','head_z','controller_x','controller_y','controller_z']].copy()
+            df = df[['timeExp','head_x','head_y','head_z','controller_x','controller_y','controller_z']].copy()
 
-        df['head_dist'] = np.sqrt(df['head_x']**2+df['head_y']**2+df['head_z']**2)
-        df['controller_dist'] = np.sqrt(df['controller_x']**2+df['controller_y']**2+df['controller_z']**2)
+            df['head_dist'] = np.sqrt(df['head_x']**2+df['head_y']**2+df['head_z']**2)
+            df['controller_dist'] = np.sqrt(df['controller_x']**2+df['controller_y']**2+df['controller_z']**2)
 
-        df['head_dist_clean'] = clean_outliers(df['timeExp'], df['head_dist'])
-        df['controller_dist_clean'] = clean_outliers(df['timeExp'], df['controller_dist'])
+            with span('clean', timings=timings):
+                df['head_dist_clean'] = clean_outliers(df['timeExp'], df['head_dist'])
+                df['controller_dist_clean'] = clean_outliers(df['timeExp'], df['controller_dist'])
 
-        df[['timeExp', 'head_dist', 'head_dist_clean']].to_csv(
-                                            os.path.join(save_path, 'head', 'dist', file_name), index = False)
-        df[['timeExp', 'controller_dist', 'controller_dist_clean']].to_csv(
+            with span('write', timings=timings):
+                df[['timeExp', 'head_dist', 'head_dist_clean']].to_csv(
+                                                os.path.join(save_path, 'head', 'dist', file_name), index = False)
+                df[['timeExp', 'controller_dist', 'controller_dist_clean']].to_csv(
                                             os.path.join(save_path, 'controller', 'dist', file_name), index = False)
 
-        df_diff = df.diff().dropna()
-        df_diff = df_diff.rename(columns = {'timeExp': 'timeFrame'})
+            df_diff = df.diff().dropna()
+            df_diff = df_diff.rename(columns = {'timeExp': 'timeFrame'})
 
-        df_diff['head_disp'] = np.sqrt(df_diff['head_x']**2+df_diff['head_y']**2+df_diff['head_z']**2)
-        controller_disp = np.sqrt(df_diff['controller_x']**2+df_diff['controller_y']**2+df_diff['controller_z']**2)
-        df_diff['controller_disp'] = controller_disp
+            df_diff['head_disp'] = np.sqrt(df_diff['head_x']**2+df_diff['head_y']**2+df_diff['head_z']**2)
+            controller_disp = np.sqrt(df_diff['controller_x']**2+df_diff['controller_y']**2+df_diff['controller_z']**2)
+            df_diff['controller_disp'] = controller_disp
 
-        df_disp = df_diff[['timeFrame','head_disp','controller_disp']]   
-        df_disp['timeExp'] = df['timeExp'][1:]
+            df_disp = df_diff[['timeFrame','head_disp','controller_disp']]   
+            df_disp['timeExp'] = df['timeExp'][1:]
 
-        if save_disp:
-            df_disp['head_disp_clean'] = clean_outliers(df_disp['timeExp'], df_disp['head_disp'])
-            df_disp['controller_disp_clean'] = clean_outliers(df_disp['timeExp'], df_disp['controller_disp'])
+            if save_disp:
+                with span('clean', timings=timings):
+                    df_disp['head_disp_clean'] = clean_outliers(df_disp['timeExp'], df_disp['head_disp'])
+                    df_disp['controller_disp_clean'] = clean_outliers(df_disp['timeExp'], df_disp['controller_disp'])
 
-            df_disp[['timeExp', 'head_disp', 'head_disp_clean']].to_csv(
+                with span('write', timings=timings):
+                    df_disp[['timeExp', 'head_disp', 'head_disp_clean']].to_csv(
                                                 os.path.join(save_path, 'head', 'disp', file_name), index = False)
-            df_disp[['timeExp', 'controller_disp', 'controller_disp_clean']].to_csv(
-                                                os.path.join(save_path, 'controller', 'disp', file_name), index = False)
-        
-        df_speed = df_disp[['timeExp']].copy()
-        df_speed['head_speed'] = df_disp['head_disp']/df_disp['timeFrame']
-        df_speed['controller_speed'] = df_disp['controller_disp']/df_disp['timeFrame']
-
-        df_speed['head_speed_clean'] = clean_outliers(df_speed['timeExp'], df_speed['head_speed'])
-        df_speed['controller_speed_clean'] = clean_outliers(df_speed['timeExp'], df_speed['controller_speed'])
-
-        df_speed[['timeExp', 'head_speed', 'head_speed_clean']].to_csv(
-                                            os.path.join(save_path, 'head', 'speed', file_name), index = False)
-        df_speed[['timeExp', 'controller_speed', 'controller_speed_clean']].to_csv(
+                    df_disp[['timeExp', 'controller_disp', 'controller_disp_clean']].to_csv(
+                                            os.path.join(save_path, 'controller', 'disp', file_name), index = False)
+            
+            df_speed = df_disp[['timeExp']].copy()
+            df_speed['head_speed'] = df_disp['head_disp']/df_disp['timeFrame']
+            df_speed['controller_speed'] = df_disp['controller_disp']/df_disp['timeFrame']
+
+            with span('clean', timings=timings):
+                df_speed['head_speed_clean'] = clean_outliers(df_speed['timeExp'], df_speed['head_speed'])
+                df_speed['controller_speed_clean'] = clean_outliers(df_speed['timeExp'], df_speed['controller_speed'])
+
+            with span('write', timings=timings):
+                df_speed[['timeExp', 'head_speed', 'head_speed_clean']].to_csv(
+                                                os.path.join(save_path, 'head', 'speed', file_name), index = False)
+                df_speed[['timeExp', 'controller_speed', 'controller_speed_clean']].to_csv(
                                             os.path.join(save_path, 'controller', 'speed', file_name), index = False)
-        
-        df_accel = df_speed.diff().dropna().rename(columns = {'timeExp': 'timeFrame', 'head_speed': 'head_accel',
-                                                            'controller_speed': 'controller_accel'})
-        df_accel['head_accel'] = df_accel['head_accel'] / df_accel['timeFrame']
-        df_accel['controller_accel'] = df_accel['controller_accel'] / df_accel['timeFrame']
-        df_accel['timeExp'] = df['timeExp'][2:]
-
-        if save_accel_clean: 
-            df_accel['head_accel_clean'] = clean_outliers(df_accel['timeExp'], df_accel['head_accel'])
-            df_accel['controller_accel_clean'] = clean_outliers(df_accel['timeExp'], df_accel['controller_accel'])
-
-            df_accel[['timeExp', 'head_accel', 'head_accel_clean']].to_csv(
-                                            os.path.join(save_path, 'head', 'accel', file_name), index = False)
-            df_accel[['timeExp', 'controller_accel', 'controller_accel_clean']].to_csv(
+            
+            df_accel = df_speed.diff().dropna().rename(columns = {'timeExp': 'timeFrame', 'head_speed': 'head_accel',
+                                                                'controller_speed': 'controller_accel'})
+            df_accel['head_accel'] = df_accel['head_accel'] / df_accel['timeFrame']
+            df_accel['controller_accel'] = df_accel['controller_accel'] / df_accel['timeFrame']
+            df_accel['timeExp'] = df['timeExp'][2:]
+
+            if save_accel_clean: 
+                with span('clean', timings=timings):
+                    df_accel['head_accel_clean'] = clean_outliers(df_accel['timeExp'], df_accel['head_accel'])
+                    df_accel['controller_accel_clean'] = clean_outliers(df_accel['timeExp'], 
+                                                                        df_accel['controller_accel'])
+
+                with span('write', timings=timings):
+                    df_accel[['timeExp', 'head_accel', 'head_accel_clean']].to_csv(
+                                                os.path.join(save_path, 'head', 'accel', file_name), index = False)
+                    df_accel[['timeExp', 'controller_accel', 'controller_accel_clean']].to_csv(
                                             os.path.join(save_path, 'controller', 'accel', file_name), index = False)
-        else:
-            df_accel[['timeExp', 'head_accel']].to_csv(
-                                            os.path.join(save_path, 'head', 'accel', file_name), index = False)
-            df_accel[['timeExp', 'controller_accel']].to_csv(
+            else:
+                with span('write', timings=timings):
+                    df_accel[['timeExp', 'head_accel']].to_csv(
+                                                os.path.join(save_path, 'head', 'accel', file_name), index = False)
+                    df_accel[['timeExp', 'controller_accel']].to_csv(
                                             os.path.join(save_path, 'controller', 'accel', file_name), index = False)
-            
-        
-        os.rename(os.path.join(raw_file_path, file), os.path.join(processed_file_path, file))
-        print(file+' done in', time.time()-temp_start)
+                
+            os.rename(os.path.join(raw_file_path, file), os.path.join(processed_file_path, file))
+            total['rows'] = len(df)
+            total.update(timings)
 
     if len(files)!=0:
         runs_file = open(os.path.join(meta_file_path, 'runs.txt'), 'r')
@@ -168,5 +186,15 @@ def correct_naming():
                     os.rename(os.path.join(cur_file_path, file), os.path.join(cur_file_path, '_'.join(new_file)))
 
 if __name__ == "__main__":
-    preprocess(sys.argv[1:])
+    parser = argparse.ArgumentParser(description='Preprocess raw files into input_data.')
+    parser.add_argument('files', nargs='*', help='Files of raw_data/raw to preprocess. Defaults to all of them.')
+    parser.add_argument('--trace', default=None, help='File to append JSON lines timing records of each stage to.')
+    parser.add_argument('--profile', default=None, 
+                        help='Directory to write a cProfile stats file for each file to.')
+    parser.add_argument('--trace-memory', action='store_true', 
+                        help='Also write the largest memory allocation sites of each file to the profile directory.')
+    args = parser.parse_args()
+
+    configure(args.trace, args.profile, args.trace_memory)
+    preprocess(args.files)
     correct_naming()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+import traceback
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+"""
+Runs a per-file function over a batch of files in a process pool. Errors are caught per file so one bad file does not
+abort the run, and the per-stage timings returned by each file are aggregated into a single report.
+"""
+
+def file_id(file_name: str):
+    """Name of a data file without its extension, used to build output file names.
+
+    Args:
+        file_name (str): File name, e.g. '1_1_1.csv'.
+    Returns:
+        str: e.g. '1_1_1'.
+    """
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+def _run_task(function, task: dict):
+    """Run function(**task) and return its timings, catching any error.
+
+    Args:
+        function (callable): Function processing one file. Must return a dict of stage name -> seconds.
+        task (dict): Keyword arguments for function. Must contain 'file_name'.
+    Returns:
+        dict: {'file' (str), 'ok' (bool), 'error' (str), 'seconds' (float), and the stage timings of function}
+    """
+    start = perf_counter()
+    try:
+        result = {'file': task['file_name'], 'ok': True, 'error': ''}
+        result.update(function(**task))
+    except Exception:
+        result = {'file': task['file_name'], 'ok': False, 'error': traceback.format_exc()}
+    result['seconds'] = perf_counter() - start
+    return result
+
+def run_batch(function, tasks: list, jobs: int = 1):
+    """Run function over every task, in a pool of jobs worker processes if jobs > 1.
+
+    Args:
+        function (callable): Module-level function processing one file, called as function(**task). Must return a
+        dict of stage name -> seconds.
+        tasks (list of dict): Keyword arguments for each call. Must contain 'file_name'.
+        jobs (int, optional): Number of worker processes. Runs in this process if 1. Defaults to 1.
+    Returns:
+        list of dict: Results of _run_task, in the same order as tasks.
+    """
+    results = [None]*len(tasks)
+    if jobs == 1:
+        for index, task in enumerate(tasks):
+            results[index] = _run_task(function, task)
+            _print_progress(results[index], index + 1, len(tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_run_task, function, task): index for index, task in enumerate(tasks)}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                _print_progress(results[futures[future]], done, len(tasks))
+    return results
+
+def _print_progress(result: dict, done: int, total: int):
+    status = f'done in {result["seconds"]:.2f} seconds' if result['ok'] else 'FAILED'
+    print(f'[{done}/{total}] {result["file"]} {status}')
+
+def print_timing(results: list, wall_time: float):
+    """Print aggregate timing of a batch run and the errors of any failed files.
+
+    Args:
+        results (list of dict): Output of run_batch.
+        wall_time (float): Wall time of the whole run in seconds.
+    """
+    failed = [result for result in results if not result['ok']]
+    for result in failed:
+        print(f'{result["file"]} failed:\n{result["error"]}')
+
+    stages = []
+    for result in results:
+        stages += [key for key in result if key not in ('file', 'ok', 'error', 'seconds') and key not in stages]
+    print(f'{len(results) - len(failed)}/{len(results)} files done in {wall_time:.2f} seconds')
+    for stage in stages + ['seconds']:
+        times = [result[stage] for result in results if result['ok'] and stage in result]
+        if len(times) > 0:
+            name = 'total' if stage == 'seconds' else stage
+            print(f'  {name}: {sum(times):.2f} seconds summed over files, max {max(times):.2f} seconds')
@@ -0,0 +1,177 @@
+import git
+import pandas as pd
+import numpy as np
+import os
+import sys
+import argparse
+from time import perf_counter
+from linear_segmentation import LinearSegmentation
+from segment_all_files import segment_total
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smoothness'))
+from smoothness_metrics import nos, nosp
+
+"""
+Checks that the faster LinearSegmentation engines give the same results as the statsmodels reference engine. Every
+engine is run over all files of a given object/variable type (e.g. controller speed) and over synthetic traces, and
+breakpoint agreement, maximum deviation in predictions and betas, change in the NoS/NoSP metrics and speedup are
+reported for each file.
+"""
+
+# Engines compared by default and whether each is meant to give exactly the reference results. 'galloping' skips 
+# candidates while p-values are far from the significance level, so it is approximate and can miss breakpoints. 'pelt' 
+# is a different algorithm that is not meant to match the reference, so it is only compared if given with --engines.
+DEFAULT_ENGINES = {'incremental': True, 'vectorized': True, 'galloping': False}
+
+def synthetic_trace(n: int,
+                    seed: int = 0,
+                    fs: float = 90,
+                    gap_every: int = 0):
+    """Piecewise linear speed-like trace with noise.
+
+    Args:
+        n (int): Number of samples.
+        seed (int, optional): Random seed. Defaults to 0.
+        fs (float, optional): Sampling frequency. Defaults to 90.
+        gap_every (int, optional): Insert a 2 second tracking gap every gap_every samples. A shorter final section is 
+        joined to the one before, so that every section has at least gap_every samples. No gaps if 0. Defaults to 0.
+    Returns:
+        pd.DataFrame: Columns ['timeExp', 'speed'].
+    """
+    rng = np.random.default_rng(seed)
+    time = np.arange(n)/fs + rng.normal(0, 1e-4, n)
+    if gap_every:
+        time += 2*np.minimum(np.arange(n)//gap_every, max(n//gap_every - 1, 0))
+    knots = np.concatenate([[0], np.sort(rng.choice(n, size=max(1, n//100), replace=False)), [n-1]])
+    speed = np.interp(np.arange(n), knots, np.abs(rng.normal(0.5, 0.4, len(knots)))) + rng.normal(0, 0.02, n)
+    return pd.DataFrame({'timeExp': time, 'speed': speed})
+
+def _nosp(y: pd.Series, fs: float, breakpoints: list, betas: np.ndarray):
+    """NoSP and the error raised computing it.
+
+    nosp reads one beta past the end when the last section of data ends without a model for its final segment, which 
+    happens when the search stops with j >= n, or is a section of fewer than two points. The comparison then fails.
+
+    Returns:
+        tuple: (NoSP or nan, repr of the error or None).
+    """
+    try:
+        return nosp(y, fs, breakpoints, betas), None
+    except IndexError as error:
+        return np.nan, repr(error)
+
+def _max_diff(a: np.ndarray, b: np.ndarray):
+    """Largest absolute difference between two arrays, counting positions where only one is nan as inf.
+    """
+    diff = np.where(np.isnan(a) & np.isnan(b), 0, np.abs(a - b))
+    return np.max(np.where(np.isnan(diff), np.inf, diff), initial=0)
+
+def compare_engines(time: pd.Series,
+                    y: pd.Series,
+                    engines: list,
+                    fs: float = 90,
+                    cut_time: float = 1,
+                    sig_level: float = 0.01,
+                    window_size: int = 10,
+                    reference: str = 'statsmodels'):
+    """Segment data with every engine and compare against the reference engine.
+
+    Args:
+        time (pd.Series): Time data.
+        y (pd.Series): y data to segment.
+        engines (list of str): Engines to compare against the reference.
+        fs (float, optional): Sampling frequency used for NoS and NoSP. Defaults to 90.
+        cut_time (float, optional): The minimum time between data points at which we break into two larger sections.
+        Defaults to 1.
+        sig_level (float, optional): Significance level. Defaults to 0.01.
+        window_size (int, optional): Window size to use in segmentation. Defaults to 10.
+        reference (str, optional): Engine to compare against. Defaults to 'statsmodels'.
+    Returns:
+        list of dict: One dictionary of comparison results per engine in engines. The betas, scale and nobs of each 
+        segment model are compared, as written to the summary by segment_all_files.
+    """
+    results = {}
+    seconds = {}
+    for engine in [reference] + engines:
+        start = perf_counter()
+        results[engine] = segment_total(time, y, cut_time=cut_time, sig_level=sig_level, window_size=window_size,
+                                        return_models=True, engine=engine)
+        seconds[engine] = perf_counter() - start
+        models = results[engine]['model_results']
+        results[engine].update({'betas': models['slope'], 'scale': models['scale'], 'nobs': models['nobs']})
+
+    ref = results[reference]
+    ref_nos = nos(y, fs, ref['breakpoints'])
+    ref_nosp, ref_nosp_error = _nosp(y, fs, ref['breakpoints'], ref['betas'])
+    rows = []
+    for engine in engines:
+        cur = results[engine]
+        same_shape = len(cur['predictions']) == len(ref['predictions']) and len(cur['betas']) == len(ref['betas'])
+        cur_nosp, cur_nosp_error = _nosp(y, fs, cur['breakpoints'], cur['betas'])
+        # NoSP is only unchanged if it could be computed for both engines
+        nosp_error = ref_nosp_error or cur_nosp_error
+        rows.append({'engine': engine,
+                     'exact': DEFAULT_ENGINES.get(engine, False),
+                     'breakpoints_equal': cur['breakpoints'] == ref['breakpoints'],
+                     'breakpoints_differing': len(set(cur['breakpoints']) ^ set(ref['breakpoints'])),
+                     'max_prediction_diff': np.max(np.abs(cur['predictions'] - ref['predictions']), initial=0)
+                                            if same_shape else np.inf,
+                     'max_beta_diff': np.max(np.abs(cur['betas'] - ref['betas']), initial=0) if same_shape else np.inf,
+                     'max_scale_diff': _max_diff(cur['scale'], ref['scale']) if same_shape else np.inf,
+                     'nobs_equal': same_shape and np.array_equal(cur['nobs'], ref['nobs']),
+                     'nos_diff': abs(nos(y, fs, cur['breakpoints']) - ref_nos),
+                     'nosp_diff': abs(cur_nosp - ref_nosp) if nosp_error is None else np.inf,
+                     'nosp_error': nosp_error,
+                     'seconds': seconds[engine],
+                     'speedup': seconds[reference]/seconds[engine]})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare LinearSegmentation engines against the reference engine.')
+    parser.add_argument('object', nargs='?', default='controller')
+    parser.add_argument('variable', nargs='?', default='speed')
+    parser.add_argument('--engines', nargs='+', default=list(DEFAULT_ENGINES), choices=list(LinearSegmentation.engines),
+                        help='Engines to compare. Defaults to those meant to match the reference: '
+                             f"{', '.join(DEFAULT_ENGINES)}, with galloping approximate.")
+    parser.add_argument('--synthetic', type=int, default=5, help='Number of synthetic traces to compare on.')
+    parser.add_argument('--synthetic-length', type=int, default=20000)
+    parser.add_argument('--no-files', action='store_true', help='Only compare on synthetic traces.')
+    args = parser.parse_args()
+
+    repo = git.Repo('.', search_parent_directories = True)
+
+    if args.object == 'controller':
+        window_size, sig_level = 10, 10**(-4)
+    else:
+        window_size, sig_level = 20, 10**(-5)
+
+    rows = []
+    for seed in range(args.synthetic):
+        df = synthetic_trace(args.synthetic_length, seed=seed, gap_every=args.synthetic_length//3)
+        for row in compare_engines(df['timeExp'], df['speed'], args.engines, sig_level=sig_level,
+                                   window_size=window_size):
+            rows.append({'file': f'synthetic_{seed}', **row})
+
+    if not args.no_files:
+        input_path = os.path.join(repo.working_tree_dir, 'input_data', args.object, args.variable)
+        col_name = f'{args.object}_{args.variable}_clean'
+        for file_name in sorted(os.listdir(input_path)):
+            df = pd.read_csv(os.path.join(input_path, file_name))
+            df = df[['timeExp', col_name]].copy().dropna().reset_index(drop=True)
+            try:
+                for row in compare_engines(df['timeExp'], df[col_name], args.engines, sig_level=sig_level,
+                                           window_size=window_size):
+                    rows.append({'file': file_name, **row})
+            except Exception as error:
+                print(file_name, 'failed:', repr(error))
+
+    report = pd.DataFrame(rows)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(report)
+    # Only engines with exact set are expected to match the reference in every column
+    print(report.groupby(['engine', 'exact']).agg({'breakpoints_equal': 'all', 'max_prediction_diff': 'max', 
+                                                   'max_beta_diff': 'max', 'max_scale_diff': 'max', 
+                                                   'nobs_equal': 'all', 'nos_diff': 'max', 'nosp_diff': 'max', 
+                                                   'nosp_error': 'count', 'speedup': 'median'}))
+    report.to_csv(os.path.join(repo.working_tree_dir, 'outputs',
+                               f'engine_comparison_{args.object}_{args.variable}.csv'), index=False)
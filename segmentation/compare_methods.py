@@ -0,0 +1,222 @@
+import git
+import os
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from time import perf_counter
+from linear_segmentation import LinearSegmentation
+from synthetic_traces import vr_session, adl_session
+
+"""
+Compares segmentation methods on synthetic sessions with known breakpoints. Every available method is run over the
+same sessions and scored by precision and recall of its breakpoints against the ground truth, wall time and peak
+memory, over a range of session lengths. Results are saved to outputs/method_comparison_<kind>.csv with plots of
+accuracy against run time and of run time against session length.
+"""
+
+def _linear(engine: str, **options):
+    """Segmenter running LinearSegmentation with the given engine."""
+    def segment(time: pd.Series, y: pd.Series, window_size: int, sig_level: float):
+        return LinearSegmentation(engine, **options).segment(time, y, window_size, sig_level)['breakpoints']
+    return segment
+
+def _clasp(time: pd.Series, y: pd.Series, window_size: int, sig_level: float):
+    """Segmenter running ClaSP with the settings of analysis/Claspy_test.py. Change points start a new segment, so the
+    breakpoint is the point before."""
+    from claspy.segmentation import BinaryClaSPSegmentation
+    clasp = BinaryClaSPSegmentation(validation='score_threshold', window_size=window_size, excl_radius=4)
+    return [int(change_point) - 1 for change_point in clasp.fit_predict(y.to_numpy())]
+
+# Method name -> function(time, y, window_size, sig_level) returning the breakpoints of one section of data
+methods = {'linear': _linear('incremental'),
+           'linear_galloping': _linear('galloping'),
+           'pelt': _linear('pelt'),
+           'clasp': _clasp}
+
+def match_breakpoints(estimated: list, truth: list, tolerance: int):
+    """Number of estimated breakpoints matched one to one to a true breakpoint at most tolerance samples away.
+
+    Args:
+        estimated (list of int): Estimated breakpoints, increasing.
+        truth (list of int): True breakpoints, increasing.
+        tolerance (int): Largest distance in samples between matched breakpoints.
+    Returns:
+        int: Number of matches.
+    """
+    matches = 0
+    k = 0
+    for breakpoint in estimated:
+        # Skip true breakpoints too far behind to be matched by this or any later estimate
+        while k < len(truth) and truth[k] < breakpoint - tolerance:
+            k += 1
+        if k < len(truth) and truth[k] <= breakpoint + tolerance:
+            matches += 1
+            k += 1
+    return matches
+
+def segment_sections(method: str,
+                     time: pd.Series,
+                     y: pd.Series,
+                     window_size: int,
+                     sig_level: float,
+                     cut_time: float = 1):
+    """Run a method over each section of data between tracking gaps.
+
+    Returns:
+        list of int: Breakpoints indexing the whole of the data, without section boundaries.
+    """
+    breakpoints = []
+    starts = [0] + list(np.flatnonzero(np.diff(time.to_numpy()) > cut_time) + 1) + [len(time)]
+    for start, stop in zip(starts[:-1], starts[1:]):
+        if stop - start < 2*window_size:
+            continue
+        section_breakpoints = methods[method](time[start:stop].reset_index(drop=True),
+                                              y[start:stop].reset_index(drop=True), window_size, sig_level)
+        breakpoints += [start + breakpoint for breakpoint in section_breakpoints]
+    return breakpoints
+
+def evaluate(method: str,
+             time: pd.Series,
+             y: pd.Series,
+             truth: list,
+             window_size: int,
+             sig_level: float,
+             tolerance: int,
+             measure_memory: bool = True):
+    """Run a method on a session and score it against the true breakpoints.
+
+    Wall time is measured without tracemalloc. Peak memory is measured in a second run with tracemalloc.
+
+    Returns:
+        dict: Number of breakpoints, precision, recall, F1 score, seconds and peak memory in MB.
+    """
+    start = perf_counter()
+    breakpoints = segment_sections(method, time, y, window_size, sig_level)
+    seconds = perf_counter() - start
+
+    peak = np.nan
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            segment_sections(method, time, y, window_size, sig_level)
+            peak = tracemalloc.get_traced_memory()[1]/2**20
+        finally:
+            tracemalloc.stop()
+
+    matches = match_breakpoints(sorted(breakpoints), truth, tolerance)
+    precision = matches/len(breakpoints) if len(breakpoints) > 0 else np.nan
+    recall = matches/len(truth) if len(truth) > 0 else np.nan
+    return {'breakpoints': len(breakpoints), 'true_breakpoints': len(truth), 'precision': precision,
+            'recall': recall, 'f1': 2*precision*recall/(precision + recall) if matches > 0 else 0.0,
+            'seconds': seconds, 'peak_memory_mb': peak}
+
+def compare_methods(names: list,
+                    kind: str = 'controller',
+                    durations: list = [1, 5, 15, 30],
+                    sessions: int = 3,
+                    tolerance_seconds: float = 0.05,
+                    max_seconds: float = 60,
+                    measure_memory: bool = True):
+    """Compare methods over synthetic sessions of increasing length.
+
+    Args:
+        names (list of str): Methods to compare, keys of methods.
+        kind (str, optional): 'controller', 'head' or 'adl', the kind of session and segmentation parameters. Defaults
+        to 'controller'.
+        durations (list of float, optional): Session lengths in minutes. Defaults to [1, 5, 15, 30].
+        sessions (int, optional): Number of sessions, with different seeds, of each length. Defaults to 3.
+        tolerance_seconds (float, optional): Largest time between a breakpoint and the true breakpoint it matches.
+        Defaults to 0.05.
+        max_seconds (float, optional): Skip longer sessions for a method once it takes longer than this on a session.
+        Defaults to 60.
+        measure_memory (bool, optional): Indicates whether to measure peak memory. Defaults to True.
+    Returns:
+        pd.DataFrame: One row per method and session.
+    """
+    # Parameters of segment_all_files.py and segment_adl.py
+    if kind == 'head':
+        window_size, sig_level = 20, 10**(-5)
+    else:
+        window_size, sig_level = 10, 10**(-4)
+
+    rows = []
+    skip = set()
+    for minutes in sorted(durations):
+        for seed in range(sessions):
+            if kind == 'adl':
+                df, truth = adl_session(minutes, seed=seed)
+                fs = 120
+                time = pd.Series(np.arange(len(df))/fs)
+                y = df['speed_clean']
+            else:
+                df, truth = vr_session(kind, minutes, seed=seed)
+                fs = 90
+                time = df['timeExp']
+                y = df[f'{kind}_speed_clean']
+            for name in names:
+                if name in skip:
+                    continue
+                try:
+                    result = evaluate(name, time, y, truth['breakpoints'], window_size, sig_level,
+                                      int(round(tolerance_seconds*fs)), measure_memory)
+                except Exception as error:
+                    print(f'{name} failed, skipping: {error!r}')
+                    skip.add(name)
+                    continue
+                rows.append({'method': name, 'minutes': minutes, 'seed': seed, 'samples': len(y), **result})
+                print(f'{name} {minutes} min seed {seed}: precision {result["precision"]:.3f}, recall '
+                      f'{result["recall"]:.3f}, {result["seconds"]:.2f} seconds')
+                if result['seconds'] > max_seconds:
+                    skip.add(name)
+    return pd.DataFrame(rows)
+
+def plot_comparison(results: pd.DataFrame, save_name: str):
+    """Plot F1 score against run time and run time against session length for each method.
+    """
+    mean = results.groupby(['method', 'samples']).mean(numeric_only=True).reset_index()
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+    for method, method_results in mean.groupby('method'):
+        ax1.scatter(method_results['seconds'], method_results['f1'], label=method)
+        ax2.plot(method_results['samples'], method_results['seconds'], marker='o', label=method)
+    ax1.set_xscale('log')
+    ax1.set_xlabel('Seconds')
+    ax1.set_ylabel('F1 score')
+    ax1.set_title('Accuracy against run time')
+    ax2.set_xscale('log')
+    ax2.set_yscale('log')
+    ax2.set_xlabel('Samples')
+    ax2.set_ylabel('Seconds')
+    ax2.set_title('Scaling with session length')
+    ax1.legend()
+    fig.tight_layout()
+    fig.savefig(save_name)
+    plt.close(fig)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare segmentation methods on synthetic sessions with known '
+                                                 'breakpoints.')
+    parser.add_argument('methods', nargs='*', default=list(methods),
+                        help=f'Methods to compare, from {", ".join(methods)}. Defaults to all.')
+    parser.add_argument('--kind', default='controller', help="'controller', 'head' or 'adl'.")
+    parser.add_argument('--minutes', nargs='+', type=float, default=[1, 5, 15, 30], help='Session lengths.')
+    parser.add_argument('--sessions', type=int, default=3, help='Number of sessions of each length.')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='Largest time in seconds between matched breakpoints.')
+    parser.add_argument('--max-seconds', type=float, default=60,
+                        help='Skip longer sessions for a method once it takes longer than this.')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure peak memory.')
+    args = parser.parse_args()
+
+    repo = git.Repo('.', search_parent_directories = True)
+
+    results = compare_methods(args.methods, args.kind, args.minutes, args.sessions, args.tolerance,
+                              args.max_seconds, not args.no_memory)
+    summary = results.groupby(['method', 'minutes']).agg({'precision': 'mean', 'recall': 'mean', 'f1': 'mean',
+                                                          'seconds': 'mean', 'peak_memory_mb': 'max'})
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(summary)
+    save_path = os.path.join(repo.working_tree_dir, 'outputs')
+    results.to_csv(os.path.join(save_path, f'method_comparison_{args.kind}.csv'), index=False)
+    plot_comparison(results, os.path.join(save_path, f'method_comparison_{args.kind}.png'))
@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import argparse
+import tracemalloc
+import contextvars
+import pandas as pd
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not recorded
+    resource = None
+
+"""
+Lightweight instrumentation of the processing scripts. Stages of the work on each file are wrapped in spans, used as
+context managers or decorators, that record wall time, CPU time, peak RSS and number of rows. Records are appended
+as JSON lines to the log file set with configure, and cProfile and tracemalloc output can be captured per file. The
+settings are stored in environment variables so that they also apply in worker processes.
+"""
+
+LOG_VARIABLE = 'INSTRUMENTATION_LOG'
+PROFILE_VARIABLE = 'INSTRUMENTATION_PROFILE_DIR'
+MEMORY_VARIABLE = 'INSTRUMENTATION_TRACE_MEMORY'
+
+# File being processed, used by spans not given a file
+_current_file = contextvars.ContextVar('current_file', default=None)
+
+def configure(log_file: str = None, profile_dir: str = None, trace_memory: bool = False):
+    """Set where instrumentation records and profiles are written, for this process and the processes it starts.
+
+    Args:
+        log_file (str, optional): File to append JSON lines records to. No records are written if None. Defaults to
+        None.
+        profile_dir (str, optional): Directory to write a cProfile stats file per file processed to. No profiling if
+        None. Defaults to None.
+        trace_memory (bool, optional): Indicates whether to trace memory allocations with tracemalloc for each file
+        and write the largest allocation sites to profile_dir. Defaults to False.
+    """
+    for variable, value in [(LOG_VARIABLE, log_file), (PROFILE_VARIABLE, profile_dir),
+                            (MEMORY_VARIABLE, '1' if trace_memory else None)]:
+        if value is None:
+            os.environ.pop(variable, None)
+        else:
+            os.environ[variable] = os.path.abspath(value) if variable != MEMORY_VARIABLE else value
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+
+def peak_rss():
+    """Peak resident set size of this process in MB, or None if it is not available.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/(2**20 if sys.platform == 'darwin' else 2**10)
+
+def write_record(record: dict):
+    """Append a record to the log file, if one is configured.
+    """
+    log_file = os.environ.get(LOG_VARIABLE)
+    if log_file is not None:
+        with open(log_file, 'a') as log:
+            log.write(json.dumps(record) + '\n')
+
+@contextmanager
+def span(stage: str, file: str = None, timings: dict = None):
+    """Time a stage of the work on a file and write a record of it.
+
+    Can be used as a context manager or a decorator. The record is yielded so that the number of rows processed can
+    be added as record['rows'], along with any other fields.
+
+    Args:
+        stage (str): Name of the stage, e.g. 'load', 'clean', 'segment', 'summarize' or 'write'.
+        file (str, optional): File being processed. Defaults to the file of the enclosing file_span.
+        timings (dict, optional): If given, the wall time is added to timings[stage]. Defaults to None.
+    Yields:
+        dict: The record, with keys 'file', 'stage', 'start', 'wall', 'cpu', 'peak_rss_mb', 'rows' and 'pid'.
+    """
+    record = {'file': file if file is not None else _current_file.get(), 'stage': stage, 'start': time.time(),
+              'rows': None}
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - wall_start
+        record['cpu'] = time.process_time() - cpu_start
+        record['peak_rss_mb'] = peak_rss()
+        record['pid'] = os.getpid()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + record['wall']
+        write_record(record)
+
+@contextmanager
+def file_span(file: str):
+    """Span of all the work on a file, which is the default file of the spans inside it.
+
+    Writes a 'total' record. If a profile directory is configured, the file is profiled with cProfile and the stats
+    are written to <profile_dir>/<file>.prof, with any '/' in file replaced by '_'. If memory tracing is also enabled,
+    the peak traced memory is added to the record and the largest allocation sites are written to
+    <profile_dir>/<file>_memory.txt.
+
+    Args:
+        file (str): File being processed, e.g. 'controller/speed/1_1_1.csv'.
+    Yields:
+        dict: The 'total' record.
+    """
+    token = _current_file.set(file)
+    profile_dir = os.environ.get(PROFILE_VARIABLE)
+    trace_memory = profile_dir is not None and os.environ.get(MEMORY_VARIABLE) is not None
+    # Folders are kept in the name so that files of the same name in different folders do not overwrite each other
+    name = os.path.splitext(file)[0].replace('/', '_').replace('\\', '_')
+    profiler = cProfile.Profile() if profile_dir is not None else None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with span('total', file) as record:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield record
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                if trace_memory:
+                    record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+    finally:
+        _current_file.reset(token)
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(profile_dir, f'{name}.prof'))
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            with open(os.path.join(profile_dir, f'{name}_memory.txt'), 'w') as memory_file:
+                for statistic in snapshot.statistics('lineno')[:25]:
+                    memory_file.write(f'{statistic}\n')
+
+def read_log(log_file: str):
+    """Records of a log file.
+
+    Returns:
+        pd.DataFrame: One row per record.
+    """
+    with open(log_file) as log:
+        return pd.DataFrame([json.loads(line) for line in log if line.strip()])
+
+def summarize_log(log_file: str):
+    """Time spent in each stage over all files of a log file.
+
+    Returns:
+        pd.DataFrame: Files, total and maximum wall time, total CPU time, rows per second and maximum peak RSS of each
+        stage, sorted by total wall time.
+    """
+    records = read_log(log_file)
+    summary = records.groupby('stage').agg(files=('file', 'nunique'), wall=('wall', 'sum'), max_wall=('wall', 'max'),
+                                           cpu=('cpu', 'sum'),
+                                           rows=('rows', lambda rows: rows.sum(min_count=1)),
+                                           peak_rss_mb=('peak_rss_mb', 'max'))
+    summary['rows_per_second'] = summary['rows']/summary['wall']
+    return summary.sort_values('wall', ascending=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize an instrumentation log by stage.')
+    parser.add_argument('log_file')
+    args = parser.parse_args()
+
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(summarize_log(args.log_file))
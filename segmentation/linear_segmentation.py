@@ -1,16 +1,239 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from scipy.stats import shapiro
+from scipy.special import stdtr
+from scipy.linalg import solveh_banded
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Fields of the model_results record array returned by LinearSegmentation.segment. Each record is a segment covering 
+# indices [start, end) with predictions intercept + slope*(x - anchor), where anchor is the x value the segment is 
+# forced through (the first x value for the first segment). scale is the residual variance of the segment regression.
+segment_dtype = np.dtype([('start', np.int64), ('end', np.int64), ('slope', np.float64), ('intercept', np.float64), 
+                          ('scale', np.float64), ('nobs', np.int64), ('anchor', np.float64)])
+
+# Fields of the residual_moments record array returned by LinearSegmentation.segment with normality_test. Each record 
+# holds the moments of the residuals of one segment about their mean: variance is the second central moment, kurtosis 
+# is not the excess kurtosis, and jb_p is the p-value of the Jarque-Bera test of normality.
+moment_dtype = np.dtype([('mean', np.float64), ('variance', np.float64), ('skewness', np.float64), 
+                         ('kurtosis', np.float64), ('jb_p', np.float64)])
+
+def predict_segments(x, model_results: np.ndarray):
+    """Rebuild predictions of segmented models.
+
+    Args:
+        x (pd.Series or np.array of float): x values the segments were fitted on.
+        model_results (np.array of segment_dtype): Segment models, e.g. model_results from LinearSegmentation.segment.
+    Returns:
+        np.array of float: Predictions for the points covered by each segment, concatenated in order.
+    """
+    x = np.asarray(x, dtype=float)
+    nobs = model_results['end'] - model_results['start']
+    offsets = np.cumsum(nobs) - nobs
+    index = np.arange(nobs.sum()) + np.repeat(model_results['start'] - offsets, nobs)
+    return (np.repeat(model_results['intercept'], nobs) + 
+            np.repeat(model_results['slope'], nobs)*(x[index] - np.repeat(model_results['anchor'], nobs)))
+
+def residual_moments(resid: np.ndarray, model_results: np.ndarray):
+    """Moments and Jarque-Bera normality test of the residuals of each segment, in one vectorised pass.
+
+    Args:
+        resid (np.array of float): Residuals of the points covered by the segments, concatenated in order as returned 
+        by predict_segments.
+        model_results (np.array of segment_dtype): Segment models, covering consecutive points.
+    Returns:
+        np.array of moment_dtype: Record array of the residual moments of each segment.
+    """
+    moments = np.zeros(len(model_results), dtype=moment_dtype)
+    if len(model_results) == 0:
+        return moments
+    nobs = model_results['end'] - model_results['start']
+    offsets = np.cumsum(nobs) - nobs
+    # Sums about the mean of each segment, which are more accurate than raw power sums
+    mean = np.add.reduceat(resid, offsets)/nobs
+    centred = resid - np.repeat(mean, nobs)
+    squared = centred*centred
+    m2 = np.add.reduceat(squared, offsets)/nobs
+    m3 = np.add.reduceat(squared*centred, offsets)/nobs
+    m4 = np.add.reduceat(squared*squared, offsets)/nobs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skewness = m3/m2**1.5
+        kurtosis = m4/(m2*m2)
+    jb = nobs/6*(skewness*skewness + (kurtosis - 3)**2/4)
+    moments['mean'] = mean
+    moments['variance'] = m2
+    moments['skewness'] = skewness
+    moments['kurtosis'] = kurtosis
+    # The Jarque-Bera statistic has a chi-squared distribution with 2 degrees of freedom, whose survival function is 
+    # exp(-x/2). Segments fitted exactly give no evidence against normality.
+    moments['jb_p'] = np.where(m2 > 0, np.exp(-jb/2), 1.0)
+    return moments
+
+def chunk_bounds(n: int, chunk_size: int, overlap: int):
+    """Start and stop indices of overlapping chunks covering n points, each chunk after the first starting overlap 
+    points before the previous chunk stops.
+
+    Args:
+        n (int): Number of points.
+        chunk_size (int): Maximum number of points in a chunk.
+        overlap (int): Number of points shared by consecutive chunks. Must be less than chunk_size.
+    Returns:
+        list of tuple: (start, stop) of each chunk.
+    """
+    assert(overlap < chunk_size)
+    bounds = []
+    start = 0
+    while True:
+        stop = min(start + chunk_size, n)
+        bounds.append((start, stop))
+        if stop == n:
+            return bounds
+        start = stop - overlap
+
+def stitch_chunks(x: pd.Series, y: pd.Series, chunks: list, tolerance: float = 1e-9):
+    """Stitch the segmentations of overlapping chunks into a segmentation of the whole data.
+
+    Each chunk is joined to the result so far at the last breakpoint in their overlap that both found and where both 
+    predict the same value, within tolerance. The segment after a breakpoint is forced through that prediction, so 
+    from a join the later chunk runs as the whole-data run does, with the point its next segment is forced through 
+    differing by at most tolerance. Up to the join the earlier chunk matches a whole-data run. A chunk started at a 
+    different point usually converges to the whole-data run within a few segments, as the difference in the point 
+    each segment is forced through roughly halves with every segment. If the overlap has no such breakpoint the chunk 
+    is joined with a single segment from the last breakpoint of the result so far to the first later breakpoint of the 
+    chunk, which may differ from a whole-data run; such chunks are counted in 'unsynced_chunks' and a larger overlap 
+    should be used. With 'unsynced_chunks' 0 the breakpoints are those of a whole-data run, unless a t-test is within 
+    the effect of tolerance of the significance level.
+
+    Args:
+        x (pd.Series of float): x values of the whole data.
+        y (pd.Series of float): y values of the whole data.
+        chunks (list of tuple): (start, stop, segmentation_dict) for each chunk in order, where segmentation_dict is 
+        the output of LinearSegmentation.segment with return_models on x[start:stop], y[start:stop].
+        tolerance (float, optional): Largest difference, in units of y, between the predictions of the two chunks at 
+        a breakpoint they are joined at. Defaults to 1e-9.
+    Returns:
+        dict: {'predictions' (np.array of float): Predictions of stitched model.
+               'breakpoints' (list of int): List of breakpoints for segments.
+               'model_results' (np.array of segment_dtype): Record array of the model for each segment.
+               'unsynced_chunks' (int): Number of chunks with no breakpoint in common with the previous chunk at which 
+               their predictions agree.}
+    """
+    xs = x.to_numpy(dtype=float)
+    ys = y.to_numpy(dtype=float)
+    breakpoints = []
+    records = np.zeros(0, dtype=segment_dtype)
+    unsynced = 0
+    prev_stop = 0
+    for start, stop, chunk in chunks:
+        chunk_breakpoints = [b + start for b in chunk['breakpoints']]
+        chunk_records = chunk['model_results'].copy()
+        chunk_records['start'] += start
+        chunk_records['end'] += start
+        if prev_stop == 0:
+            breakpoints, records = chunk_breakpoints, chunk_records
+            prev_stop = stop
+            continue
+        common = sorted(set(breakpoints).intersection(chunk_breakpoints).intersection(range(start, prev_stop)))
+        # Breakpoints where the segments they close agree on the point the next segment is forced through
+        common = [b for b in common if abs(_prediction_at(xs, records, b) - _prediction_at(xs, chunk_records, b)) 
+                  <= tolerance]
+        if len(common) > 0:
+            join = common[-1]
+            breakpoints = [b for b in breakpoints if b <= join] + [b for b in chunk_breakpoints if b > join]
+            records = np.concatenate([records[records['end'] <= join + 1], chunk_records[chunk_records['start'] > join]])
+        else:
+            unsynced += 1
+            # Join with one segment from the last breakpoint before the overlap ends to the next chunk breakpoint
+            kept = [b for b in breakpoints if b < prev_stop]
+            join_start = kept[-1] + 1 if kept else 0
+            later = [b for b in chunk_breakpoints if b + 1 > join_start]
+            join_stop = later[0] + 1 if later else stop
+            records = records[records['end'] <= join_start]
+            joining = np.zeros(1, dtype=segment_dtype)
+            if join_start == 0:
+                a = xs[:join_stop] - xs[0]
+                d = ys[:join_stop] - ys[0]
+                sxx = np.dot(a - a.mean(), a)
+                slope = np.dot(a - a.mean(), d)/sxx if sxx > 0 else 0.0
+                joining[0] = (0, join_stop, slope, ys[0] + d.mean() - slope*a.mean(), np.nan, join_stop, xs[0])
+            else:
+                prev_pred = predict_segments(xs, records[-1:])[-1]
+                a = xs[join_start:join_stop] - xs[join_start-1]
+                saa = np.dot(a, a)
+                slope = np.dot(a, ys[join_start:join_stop] - prev_pred)/saa if saa > 0 else 0.0
+                joining[0] = (join_start, join_stop, slope, prev_pred, np.nan, join_stop - join_start, 
+                              xs[join_start-1])
+            resid = ys[join_start:join_stop] - predict_segments(xs, joining)
+            # Residual degrees of freedom, with one fitted parameter or two for the first segment
+            dof = joining['nobs'][0] - 1 - (join_start == 0)
+            joining['scale'] = np.dot(resid, resid)/dof if dof > 0 else np.nan
+            breakpoints = kept + later
+            records = np.concatenate([records, joining, chunk_records[chunk_records['start'] >= join_stop]])
+        prev_stop = stop
+
+    return {'predictions': predict_segments(xs, records), 'breakpoints': breakpoints, 'model_results': records, 
+            'unsynced_chunks': unsynced}
+
+def _prediction_at(xs: np.ndarray, records: np.ndarray, breakpoint: int):
+    """Prediction at a breakpoint of the segment it closes, the point the next segment is forced through.
+    """
+    closing = records[records['end'] == breakpoint + 1]
+    if len(closing) == 0:
+        return np.nan
+    return closing['intercept'][0] + closing['slope'][0]*(xs[breakpoint] - closing['anchor'][0])
+
+def _segment_chunk(engine: str, x: pd.Series, y: pd.Series, window_size: int, sig_level: float):
+    """Segment one chunk with models. Module level so it can be run in a worker process.
+    """
+    return LinearSegmentation(engine).segment(x, y, window_size=window_size, sig_level=sig_level, return_models=True)
 
 class LinearSegmentation:
     """
     Linear segmentation procedure
     """    
-    def __init__(self):
+    def __init__(self, 
+                 engine: str = 'statsmodels', 
+                 far_factor: float = 100, 
+                 max_step: int = 4, 
+                 penalty = 'bic'):
         """Initialiser function for class.
+
+        Args:
+            engine (str, optional): Engine used to fit the left segment and right window at each step. One of the keys 
+            of LinearSegmentation.engines, see register_engine to add more. 'statsmodels' fits two sm.OLS models per 
+            step and is the reference implementation. 'incremental' keeps running sums for the left segment and right 
+            window and computes the same fits and t-test in closed form in O(1) per step. 'vectorized' computes the 
+            p-values of all candidate breakpoints for the current left anchor at once from cumulative sums. 'galloping' 
+            is the incremental engine with a coarse-to-fine search that skips candidates while p-values are far from 
+            the significance level. 'pelt' replaces the sequential t-test with penalised optimal partitioning of the 
+            whole series, see _segment_pelt. Defaults to 'statsmodels'.
+            far_factor (float, optional): Used by the 'galloping' engine. Candidates are only skipped while p-values 
+            are above far_factor*sig_level. Defaults to 100.
+            max_step (int, optional): Used by the 'galloping' engine. Largest step between tested candidates. Larger 
+            steps skip more tests but make missing a breakpoint more likely. Defaults to 4.
+            penalty (str or float, optional): Used by the 'pelt' engine. Cost added per breakpoint, in units of squared 
+            residuals, or 'bic' for the BIC penalty of the piecewise linear fit of independent lines whose cost the 
+            engine minimises, see _bic_penalty. Defaults to 'bic'.
         """     
-        pass
+        assert(engine in self.engines)
+        self.engine = engine
+        self.far_factor = far_factor
+        self.max_step = max_step
+        self.penalty = penalty
+        # Counters of the current segment call, None unless return_counters is set, see _store_counters
+        self._counters = None
+
+    @classmethod
+    def register_engine(cls, name: str, engine):
+        """Register a segmentation engine so it can be selected by name.
+
+        Args:
+            name (str): Name of the engine.
+            engine (callable): Function called as engine(self, x, y, window_size, sig_level, return_models, 
+            normality_test), returning the same dictionary as segment. Engines can report counters with 
+            _store_counters.
+        """
+        cls.engines[name] = engine
 
     def segment(self,
                 x: pd.Series, 
@@ -18,7 +241,8 @@ class LinearSegmentation:
                 window_size: int = 10, 
                 sig_level: float = 0.01,
                 return_models: bool = False,
-                normality_test: bool = False):
+                normality_test: bool = False,
+                return_counters: bool = False):
         """Apply segmentation procedure.
 
         Args:
@@ -29,31 +253,381 @@ class LinearSegmentation:
             x.name (str, optional): Name of the x data
             return_models (bool, optional): Indicates whether to return the models for each segment. Defaults to False.
             normality_test (bool, optional): Indicates whether to return normality test results for residuals of 
-            regressions. Defaults to False.
+            regressions. Does not require return_models. Defaults to False.
+            return_counters (bool, optional): Indicates whether to return counters of the work done. Timing the fits 
+            and tests adds a small overhead. Defaults to False.
         Returns:
-            dict: {'predictions' (pd.Series of float): Predictions of fitted model.
+            dict: {'predictions' (np.array of float): Predictions of fitted model.
                    'breakpoints' (list of int): List of breakpoints for segments.
-                   'model_results' (list of RegressionResults): List of models for each segment. Requires 
-                   return_models to be returned.}
+                   'model_results' (np.array of segment_dtype): Record array of the model for each segment, see 
+                   predict_segments to rebuild predictions. Requires return_models to be returned.
+                   'residual_moments' (np.array of moment_dtype): Record array of the residual moments of each 
+                   segment. Requires normality_test to be returned.
+                   'mean_normal_p' (float): Mean of the Jarque-Bera p-values of the segments closed by a breakpoint, 
+                   nan if there are none. Requires normality_test to be returned.
+                   'sig_normal_p' (float): Proportion of the segments closed by a breakpoint with a Jarque-Bera 
+                   p-value below 0.01, nan if there are none. Requires normality_test to be returned.
+                   'tests' (int): Number of t-tests performed. Only returned by the 'galloping' engine.
+                   'skipped_tests' (int): Number of candidate breakpoints skipped without a t-test. Only returned by the
+                   'galloping' engine.
+                   'penalty' (float): Cost added per breakpoint. Only returned by the 'pelt' engine.
+                   'counters' (dict): {'fits' (int): Number of OLS fits, counting the left segment and right window 
+                   fits of each step and the fit of the final section, 'tests' (int): Number of t-tests, 'advances' 
+                   (int): Number of times the window moved on by one point without a breakpoint, 'accepted' (int): 
+                   Number of breakpoints, 'rejected' (int): Number of significant t-tests rejected by the pvalue > q 
+                   rule, 'fit_seconds' (float): Time spent fitting, 'test_seconds' (float): Time spent in t-tests}. 
+                   The 'vectorized' engine counts every candidate it evaluates, including those after the breakpoint 
+                   in the same block. The 'pelt' engine counts each candidate segment cost as a fit and has no 
+                   t-tests. Requires return_counters to be returned.}
+        """
+        assert(len(x) == len(y))
+        self._counters = {} if return_counters else None
+        try:
+            return_dict = self.engines[self.engine](self, x, y, window_size, sig_level, return_models, normality_test)
+            if return_counters:
+                return_dict['counters'] = self._counters
+        finally:
+            self._counters = None
+        return return_dict
+
+    def segment_chunked(self,
+                        x: pd.Series,
+                        y: pd.Series,
+                        window_size: int = 10,
+                        sig_level: float = 0.01,
+                        return_models: bool = False,
+                        chunk_size: int = 100000,
+                        overlap: int = 3000,
+                        jobs: int = 1,
+                        tolerance: float = 1e-9):
+        """Apply segmentation procedure to overlapping chunks of the data, in parallel if jobs > 1, and stitch the 
+        chunks back together with stitch_chunks. Memory used by each chunk is bounded by chunk_size.
+
+        The breakpoints match a segment run on the whole data when every overlap contains a breakpoint found by both 
+        neighbouring chunks at which their predictions agree within tolerance ('unsynced_chunks' is 0), see 
+        stitch_chunks. On 90 Hz speed data this takes well under the default overlap of 3000 points.
+
+        Args:
+            x (pd.Series of float): x values. Must be same length as y.
+            y (pd.Series of float): y values. Must be same length as x.
+            window_size (int, optional): Size for window. Defaults to 10.
+            sig_level (float, optional): Significance level for statistical difference. Defaults to 0.01.
+            return_models (bool, optional): Indicates whether to return the models for each segment. Defaults to False.
+            chunk_size (int, optional): Maximum number of points in a chunk. Defaults to 100000.
+            overlap (int, optional): Number of points shared by consecutive chunks. Defaults to 3000.
+            jobs (int, optional): Number of worker processes. Defaults to 1.
+            tolerance (float, optional): Largest difference, in units of y, between the predictions of neighbouring 
+            chunks at a breakpoint they are joined at. Defaults to 1e-9.
+        Returns:
+            dict: As for segment, with 'unsynced_chunks' (int): Number of chunks with no breakpoint in common with the 
+            previous chunk at which their predictions agree.
+        """
+        assert(len(x) == len(y))
+        bounds = chunk_bounds(len(x), chunk_size, overlap)
+        chunk_args = ([self.engine]*len(bounds), 
+                      [x[start:stop].reset_index(drop=True) for start, stop in bounds], 
+                      [y[start:stop].reset_index(drop=True) for start, stop in bounds], 
+                      [window_size]*len(bounds), [sig_level]*len(bounds))
+        if jobs > 1 and len(bounds) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(bounds))) as executor:
+                chunk_dicts = list(executor.map(_segment_chunk, *chunk_args))
+        else:
+            chunk_dicts = list(map(_segment_chunk, *chunk_args))
+
+        return_dict = stitch_chunks(x, y, [(start, stop, chunk_dict) 
+                                           for (start, stop), chunk_dict in zip(bounds, chunk_dicts)], tolerance)
+        if not return_models:
+            del return_dict['model_results']
+        return return_dict
+
+    def sweep(self,
+              x: pd.Series,
+              y: pd.Series,
+              window_sizes: list = [10, 20],
+              sig_levels: list = [10**(-4), 10**(-5)],
+              block_size: int = 32,
+              return_counters: bool = False):
+        """Apply segmentation procedure for every combination of window size and significance level at once.
+
+        The right window sums are computed once per window size and every configuration advances together, see 
+        _segment_together. The breakpoints are those of segment, up to floating point rounding.
+
+        Args:
+            x (pd.Series of float): x values. Must be same length as y.
+            y (pd.Series of float): y values. Must be same length as x.
+            window_sizes (list of int, optional): Window sizes to use. Defaults to [10, 20].
+            sig_levels (list of float, optional): Significance levels to use. Defaults to [10**(-4), 10**(-5)].
+            block_size (int, optional): Number of candidates tested per configuration at each iteration. Defaults to 32.
+            return_counters (bool, optional): Indicates whether to also return counters of the work done for each 
+            configuration, see _segment_together. Defaults to False.
+        Returns:
+            dict: {(window_size, sig_level): breakpoints (list of int)} for every combination. If return_counters, a 
+            tuple of this and {(window_size, sig_level): counters (dict)}, with the counters of segment except for 
+            the fit of the final section, which sweep does not do.
         """
         assert(len(x) == len(y))
+        configs = [(w, sig_level) for w in window_sizes for sig_level in sig_levels]
+        self._counters = {} if return_counters else None
+        try:
+            breakpoints, _, _, counters = self._segment_together(x.to_numpy(dtype=float), 
+                                                                 y.to_numpy(dtype=float)[None], 
+                                                                 np.zeros(len(configs), dtype=int), 
+                                                                 np.array([config[0] for config in configs]), 
+                                                                 np.array([config[1] for config in configs]), 
+                                                                 block_size)
+        finally:
+            self._counters = None
+        results = {config: config_breakpoints for config, config_breakpoints in zip(configs, breakpoints)}
+        if return_counters:
+            return results, dict(zip(configs, counters))
+        return results
+
+    def segment_channels(self,
+                         x: pd.Series,
+                         y,
+                         window_size = 10,
+                         sig_level = 0.01,
+                         return_models: bool = False,
+                         normality_test: bool = False,
+                         block_size: int = 32,
+                         return_counters: bool = False):
+        """Apply segmentation procedure to several y channels sharing the same x values in a single pass.
+
+        Sums of x over the right window are computed once for all channels. Every channel then advances together as in 
+        sweep, with the left segment fits and t-tests of all channels vectorized across columns. The breakpoints of 
+        each channel are those of segment on that channel, up to floating point rounding.
+
+        Args:
+            x (pd.Series of float): x values. Must be same length as y.
+            y (pd.DataFrame or np.ndarray of float): One column of y values per channel. Must be same length as x.
+            window_size (int or list of int, optional): Size for window, or one size per channel. Defaults to 10.
+            sig_level (float or list of float, optional): Significance level for statistical difference, or one level 
+            per channel. Defaults to 0.01.
+            return_models (bool, optional): Indicates whether to return the models for each segment. Defaults to False.
+            normality_test (bool, optional): Indicates whether to return normality test results for residuals of 
+            regressions. Defaults to False.
+            block_size (int, optional): Number of candidates tested per channel at each iteration. Defaults to 32.
+            return_counters (bool, optional): Indicates whether to return counters of the work done for each channel, 
+            see _segment_together. Defaults to False.
+        Returns:
+            list of dict: The dictionary returned by segment for each channel, in column order.
+        """
+        assert(len(x) == len(y))
+        yv = np.asarray(y, dtype=float).T
+        channels = len(yv)
+        window_sizes = np.broadcast_to(window_size, channels).astype(int)
+        sig_levels = np.broadcast_to(sig_level, channels).astype(float)
+        self._counters = {} if return_counters else None
+        try:
+            breakpoints, segments, (i, j, prev_pred), counters = self._segment_together(x.to_numpy(dtype=float), yv, 
+                                                                                        np.arange(channels), 
+                                                                                        window_sizes, sig_levels, 
+                                                                                        block_size)
+            return_dicts = []
+            for c in range(channels):
+                # The fit of the final section is counted by _collect_results in the counters of its channel
+                self._counters = counters[c] if return_counters else None
+                return_dicts.append(self._collect_results(x, pd.Series(yv[c]), breakpoints[c], segments[c], int(i[c]), 
+                                                          int(j[c]), prev_pred[c], return_models, normality_test))
+                if return_counters:
+                    return_dicts[-1]['counters'] = counters[c]
+        finally:
+            self._counters = None
+        return return_dicts
+
+    def _segment_together(self,
+                          xv: np.ndarray,
+                          yv: np.ndarray,
+                          rows_y: np.ndarray,
+                          w: np.ndarray,
+                          sig: np.ndarray,
+                          block_size: int):
+        """Run several segmentations over the same x values together, each with its own y row, window size and 
+        significance level. Used by sweep and segment_channels.
+
+        The right window sums are computed once per window size, and once per window size and y row for the sums 
+        involving y. At each iteration the next block_size candidate breakpoints of every configuration are tested in 
+        one NumPy pass, carrying each configuration's left segment sums from one block to the next as the incremental 
+        engine does.
+
+        If counters are being collected, each configuration gets its own counters, as described in segment. As in the 
+        'vectorized' engine every candidate evaluated is counted, including those after the breakpoint in the same 
+        block. The time of each joint pass is shared between configurations in proportion to the candidates each 
+        evaluated in it.
+
+        Args:
+            xv (np.ndarray of float): x values.
+            yv (np.ndarray of float): y values, one row per series.
+            rows_y (np.ndarray of int): Row of yv segmented by each configuration.
+            w (np.ndarray of int): Window size of each configuration.
+            sig (np.ndarray of float): Significance level of each configuration.
+            block_size (int): Number of candidates tested per configuration at each iteration.
+        Returns:
+            tuple: (breakpoints (list of list of int), segments (list of list of tuple), (i, j, prev_pred), counters 
+            (list of dict or None)) for each configuration, where segments and the final values of i, j and prev_pred 
+            are as used by _collect_results. counters are None unless counters are being collected.
+        """
+        n = len(xv)
+        # Right window sums for each window size, nan where the window runs past the end of the data. The sums of u 
+        # only depend on x and are shared by every y row.
+        distinct_w = sorted(set(w.tolist()))
+        w_index = np.searchsorted(distinct_w, w)
+        right_x = np.full((2, len(distinct_w), n), np.nan)
+        right_y = np.full((3, len(distinct_w), len(yv), n), np.nan)
+        for k, window_size in enumerate(distinct_w):
+            if window_size <= n:
+                s_u, s_uu, s_uy, s_y, s_yy = self._right_window_sums(xv, yv, window_size)
+                right_x[:, k, :n - window_size + 1] = s_u, s_uu
+                right_y[:, k, :, :n - window_size + 1] = s_uy, s_y, s_yy
+
+        # State of each configuration: left segment [i, j) with its anchor point and sums of a, d, a^2, ad where 
+        # a = x - x0 and d = y - y0, the last p-value and left segment fit, and the segments so far
+        breakpoints = [[] for _ in w]
+        segments = [[] for _ in w]
+        i = np.zeros(len(w), dtype=int)
+        j = w.copy()
+        x0 = np.full(len(w), xv[0] if n > 0 else 0.0)
+        y0 = yv[rows_y, 0] if n > 0 else np.zeros(len(w))
+        sums = np.zeros((4, len(w)))
+        q = np.ones(len(w))
+        prev_slope = np.zeros(len(w))
+        prev_anchor_y = np.zeros(len(w))
+        active = j + w <= n
+        timing = self._counters is not None
+        tests = np.zeros(len(w), dtype=int)
+        advances = np.zeros(len(w), dtype=int)
+        rejected = np.zeros(len(w), dtype=int)
+        fit_seconds = np.zeros(len(w))
+        test_seconds = np.zeros(len(w))
+
+        def start_segment(rows):
+            # Left segment sums over [i, j) for new segments
+            k = i[rows, None] + np.arange(w.max())
+            inside = k < j[rows, None]
+            k = np.minimum(k, n - 1)
+            a = np.where(inside, xv[k] - x0[rows, None], 0)
+            d = np.where(inside, yv[rows_y[rows, None], k] - y0[rows, None], 0)
+            sums[:, rows] = [a.sum(axis=1), d.sum(axis=1), (a*a).sum(axis=1), (a*d).sum(axis=1)]
+
+        start_segment(np.flatnonzero(active))
+        offsets = np.arange(block_size)
+        while active.any():
+            rows = np.flatnonzero(active)
+            if timing:
+                start = perf_counter()
+            candidates = j[rows, None] + offsets
+            # Candidates past the end of the data get nan right window sums, so a nan p-value that is never a hit
+            k = np.minimum(candidates, n - 1)
+            # Left segment sums over [i, candidate): carried sums plus the points j, ..., candidate - 1
+            a = xv[k] - x0[rows, None]
+            d = yv[rows_y[rows, None], k] - y0[rows, None]
+            terms = np.stack((a, d, a*a, a*d))
+            totals = np.cumsum(terms, axis=2) + sums[:, rows, None]
+            s_a, s_d, s_aa, s_ad = totals - terms
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Regression forced through previous section, or with constant for the first segment
+                slopes = s_ad/s_aa
+                anchor_ys = np.broadcast_to(y0[rows, None], slopes.shape)
+                constant = i[rows] == 0
+                if constant.any():
+                    c_a, c_d, c_aa, c_ad = s_a[constant], s_d[constant], s_aa[constant], s_ad[constant]
+                    m = candidates[constant]
+                    slopes[constant] = (c_ad - c_a*c_d/m)/(c_aa - c_a*c_a/m)
+                    anchor_ys = anchor_ys.copy()
+                    anchor_ys[constant] += (c_d - slopes[constant]*c_a)/m
+                final_preds = anchor_ys + slopes*a
+                # Right window regressions forced through intersection
+                s_u, s_uu = right_x[:, w_index[rows, None], k]
+                s_uy, s_y, s_yy = right_y[:, w_index[rows, None], rows_y[rows, None], k]
+                s_uv = s_uy - final_preds*s_u
+                s_vv = s_yy - 2*final_preds*s_y + w[rows, None]*final_preds*final_preds
+                right_slopes = s_uv/s_uu
+                ssr = np.maximum(s_vv - right_slopes*s_uv, 0)
+                tvalues = (right_slopes - slopes)/np.sqrt(ssr/(w[rows, None] - 1)/s_uu)
+            if timing:
+                fitted = perf_counter()
+            pvalues = 2*stdtr(w[rows, None] - 1, -np.abs(tvalues))
+            # If the t-test is significant but less significant than the previous step then return that section
+            prev_pvalues = np.concatenate((q[rows, None], pvalues[:, :-1]), axis=1)
+            hits = (pvalues < sig[rows, None]) & (pvalues > prev_pvalues)
+            has_hit = hits.any(axis=1)
+            if timing:
+                tested = perf_counter()
+                # Candidates with a full right window, and those passed before the first hit
+                valid = candidates + w[rows, None] <= n
+                passed = valid & (offsets < np.where(has_hit, hits.argmax(axis=1), block_size)[:, None])
+                tests[rows] += valid.sum(axis=1)
+                advances[rows] += passed.sum(axis=1)
+                rejected[rows] += (passed & (pvalues < sig[rows, None])).sum(axis=1)
+                share = valid.sum(axis=1)/max(valid.sum(), 1)
+                fit_seconds[rows] += share*(fitted - start)
+                test_seconds[rows] += share*(tested - fitted)
+
+            if has_hit.any():
+                # Close the segment at the step before the first hit and start a new one
+                hit_rows = rows[has_hit]
+                first = hits[has_hit].argmax(axis=1)
+                before = np.maximum(first - 1, 0)
+                closed_slope = np.where(first > 0, slopes[has_hit, before], prev_slope[hit_rows])
+                closed_anchor_y = np.where(first > 0, anchor_ys[has_hit, before], prev_anchor_y[hit_rows])
+                hit_j = candidates[has_hit, first]
+                for row, hit, slope, anchor_y in zip(hit_rows, hit_j, closed_slope, closed_anchor_y):
+                    breakpoints[row].append(int(hit) - 2)
+                    segments[row].append((int(i[row]), int(hit) - 1, slope, x0[row], anchor_y))
+                y0[hit_rows] = closed_anchor_y + closed_slope*(xv[hit_j - 2] - x0[hit_rows])
+                x0[hit_rows] = xv[hit_j - 2]
+                i[hit_rows] = hit_j - 1
+                j[hit_rows] = hit_j + w[hit_rows] - 1
+                q[hit_rows] = 1
+                active[hit_rows] = j[hit_rows] + w[hit_rows] <= n
+                start_segment(hit_rows[active[hit_rows]])
+
+            # Carry the state of the other configurations to the next block. A configuration running out of data 
+            # stops at n - w + 1 as in the sequential search.
+            miss = ~has_hit
+            miss_rows = rows[miss]
+            sums[:, miss_rows] = totals[:, miss, -1]
+            q[miss_rows] = pvalues[miss, -1]
+            prev_slope[miss_rows] = slopes[miss, -1]
+            prev_anchor_y[miss_rows] = anchor_ys[miss, -1]
+            j[miss_rows] = np.minimum(j[miss_rows] + block_size, n - w[miss_rows] + 1)
+            active[miss_rows] = j[miss_rows] + w[miss_rows] <= n
+
+        counters = None
+        if timing:
+            counters = [dict(fits=2*int(tests[k]), tests=int(tests[k]), advances=int(advances[k]), 
+                             accepted=len(breakpoints[k]), rejected=int(rejected[k]), 
+                             fit_seconds=float(fit_seconds[k]), test_seconds=float(test_seconds[k])) 
+                        for k in range(len(w))]
+        return breakpoints, segments, (i, j, y0), counters
+
+    def _segment_statsmodels(self,
+                             x: pd.Series,
+                             y: pd.Series,
+                             window_size: int,
+                             sig_level: float,
+                             return_models: bool,
+                             normality_test: bool):
+        """Apply segmentation procedure fitting sm.OLS models at every step. This is the reference implementation; see 
+        segment for arguments and return values.
+        """
         # Initialise variables
         breakpoints = []
-        predictions = []
-        if return_models:
-            # Will store all the models
-            model_results = []
+        # (start, stop, slope, anchor_x, anchor_y) for each segment, predictions are anchor_y + slope*(x - anchor_x)
+        segments = []
         i = 0
         j = window_size
         q = 1
         prev_pred = 0
         # prev_pred will be the next prediction of the left segment - the right window will be forced to go through
         # this point.
-        if normality_test:
-            shapiro_sig_count = 0
-            shapiro_total_p = 0
+        timing = self._counters is not None
+        fits = tests = advances = rejected = 0
+        fit_seconds = test_seconds = 0.0
 
         while j + window_size <= len(x):
+            if timing:
+                start = perf_counter()
             # Special case for first linear regression
             if i == 0:
                 # Regression with constant
@@ -68,20 +642,24 @@ class LinearSegmentation:
             # Right window regression forced through intersection
             right_model = sm.OLS(y[j:j+window_size] - final_pred, x[j:j+window_size]-x[j])
             right_results = right_model.fit(use_t=True)
+            fits += 2
+            if timing:
+                fitted = perf_counter()
+                fit_seconds += fitted - start
             # Perform t-test
             pvalue = right_results.t_test(f'{x.name} = {left_results.params[x.name]}').pvalue
+            tests += 1
+            if timing:
+                test_seconds += perf_counter() - fitted
             # If the t-test is significant but less significant than the previous section then return that section
             if pvalue < sig_level and pvalue > q:
-                # Add breakpoint and predictions
+                # Add breakpoint and segment
                 breakpoints.append(j - 2)
-                predictions = np.append(predictions, prev_predictions)
-                if return_models:
-                    model_results.append(prev_results)
-                    if normality_test:
-                        shapiro_p = shapiro(prev_results.resid).pvalue
-                        if shapiro_p < 0.01:
-                            shapiro_sig_count+=1
-                        shapiro_total_p += shapiro_p
+                slope = prev_results.params[x.name]
+                if i == 0:
+                    segments.append((i, j - 1, slope, x[0], prev_results.params['const'] + slope*x[0]))
+                else:
+                    segments.append((i, j - 1, slope, x[i-1], prev_pred))
                 # Update variables to indicate new segment being created
                 prev_pred = prev_predictions[-1]
                 i = j - 1
@@ -89,26 +667,642 @@ class LinearSegmentation:
                 q = 1
             else:
                 # Move section
+                rejected += pvalue < sig_level
+                advances += 1
                 j += 1
                 q = pvalue
-                if return_models:
-                    prev_results = left_results
+                prev_results = left_results
                 # Keep track of predictions of previous section
                 prev_predictions = left_results.predict() + prev_pred
+
+        self._store_counters(fits, tests, advances, len(breakpoints), rejected, fit_seconds, test_seconds)
+        return self._collect_results(x, y, breakpoints, segments, i, j, prev_pred, return_models, normality_test)
+
+    def _segment_incremental(self,
+                             x: pd.Series,
+                             y: pd.Series,
+                             window_size: int,
+                             sig_level: float,
+                             return_models: bool,
+                             normality_test: bool):
+        """Apply segmentation procedure using closed-form OLS from running sums. Gives the same breakpoints as the 
+        statsmodels engine; see segment for arguments and return values.
+
+        The left segment sums are kept relative to its anchor point (the first point if it is the first segment, else 
+        the last prediction of the previous segment) so they only ever grow. The right window sums are kept relative 
+        to x[j] and re-centred by the step in x each time the window slides, which avoids cancellation for large 
+        timestamps.
+        """
+        xs = x.to_numpy(dtype=float).tolist()
+        ys = y.to_numpy(dtype=float).tolist()
+        n = len(xs)
+        w = window_size
+        df_right = w - 1
+
+        breakpoints = []
+        # (start, stop, slope, anchor_x, anchor_y) for each segment, predictions are anchor_y + slope*(x - anchor_x)
+        segments = []
+        i = 0
+        j = w
+        q = 1
+        prev_pred = 0
+
+        def reset_sums():
+            # Left segment sums over [i, j), relative to the anchor point
+            if i == 0:
+                x0, y0 = xs[0], ys[0]
+            else:
+                x0, y0 = xs[i-1], prev_pred
+            s_a = s_d = s_aa = s_ad = 0.0
+            for k in range(i, j):
+                a = xs[k] - x0
+                d = ys[k] - y0
+                s_a += a
+                s_d += d
+                s_aa += a*a
+                s_ad += a*d
+            # Right window sums over [j, j + w), with u relative to x[j]
+            s_u = s_uu = s_uy = s_y = s_yy = 0.0
+            for k in range(j, j + w):
+                u = xs[k] - xs[j]
+                s_u += u
+                s_uu += u*u
+                s_uy += u*ys[k]
+                s_y += ys[k]
+                s_yy += ys[k]*ys[k]
+            return x0, y0, [s_a, s_d, s_aa, s_ad], [s_u, s_uu, s_uy, s_y, s_yy]
+
+        timing = self._counters is not None
+        fits = tests = advances = rejected = 0
+        fit_seconds = test_seconds = 0.0
+
+        if j + w <= n:
+            x0, y0, left, right = reset_sums()
+        while j + w <= n:
+            if timing:
+                start = perf_counter()
+            s_a, s_d, s_aa, s_ad = left
+            s_u, s_uu, s_uy, s_y, s_yy = right
+            # Left segment regression
+            if i == 0:
+                # Regression with constant, in coordinates centred on the first point
+                m = j
+                slope = (s_ad - s_a*s_d/m)/(s_aa - s_a*s_a/m)
+                anchor_y = y0 + (s_d - slope*s_a)/m
+            else:
+                # Regression forced through previous section
+                slope = s_ad/s_aa
+                anchor_y = y0
+            final_pred = anchor_y + slope*(xs[j] - x0)
+            # Right window regression forced through intersection
+            s_uv = s_uy - final_pred*s_u
+            s_vv = s_yy - 2*final_pred*s_y + w*final_pred*final_pred
+            right_slope = s_uv/s_uu
+            ssr = max(s_vv - right_slope*s_uv, 0.0)
+            fits += 2
+            if timing:
+                fitted = perf_counter()
+                fit_seconds += fitted - start
+            # Perform t-test
+            tvalue = np.float64(right_slope - slope)/np.sqrt(ssr/df_right/s_uu)
+            pvalue = 2*stdtr(df_right, -abs(tvalue))
+            tests += 1
+            if timing:
+                test_seconds += perf_counter() - fitted
+            # If the t-test is significant but less significant than the previous section then return that section
+            if pvalue < sig_level and pvalue > q:
+                breakpoints.append(j - 2)
+                segments.append((i, j - 1, prev_slope, x0, prev_anchor_y))
+                prev_pred = prev_anchor_y + prev_slope*(xs[j-2] - x0)
+                i = j - 1
+                j = j + w - 1
+                q = 1
+                if j + w <= n:
+                    x0, y0, left, right = reset_sums()
+            else:
+                rejected += pvalue < sig_level
+                advances += 1
+                # Add x[j] to the left segment
+                a = xs[j] - x0
+                d = ys[j] - y0
+                left = [s_a + a, s_d + d, s_aa + a*a, s_ad + a*d]
+                if j + w < n:
+                    # Slide the right window: drop x[j] (u = 0), add x[j + w], then re-centre on x[j + 1]
+                    y_old = ys[j]
+                    y_new = ys[j+w]
+                    u = xs[j+w] - xs[j]
+                    s_u += u
+                    s_uu += u*u
+                    s_uy += u*y_new
+                    s_y += y_new - y_old
+                    s_yy += y_new*y_new - y_old*y_old
+                    delta = xs[j+1] - xs[j]
+                    s_uu = s_uu - 2*delta*s_u + w*delta*delta
+                    s_uy = s_uy - delta*s_y
+                    s_u = s_u - w*delta
+                    right = [s_u, s_uu, s_uy, s_y, s_yy]
+                j += 1
+                q = pvalue
+                prev_slope = slope
+                prev_anchor_y = anchor_y
+        self._store_counters(fits, tests, advances, len(breakpoints), rejected, fit_seconds, test_seconds)
+        return self._collect_results(x, y, breakpoints, segments, i, j, prev_pred, return_models, normality_test)
+
+    def _segment_vectorized(self,
+                            x: pd.Series,
+                            y: pd.Series,
+                            window_size: int,
+                            sig_level: float,
+                            return_models: bool,
+                            normality_test: bool):
+        """Apply segmentation procedure evaluating every candidate breakpoint for the current left anchor in one NumPy 
+        pass. Gives the same breakpoints as the statsmodels engine; see segment for arguments and return values.
+
+        Candidates are evaluated in blocks that double in size until the stopping rule fires, so each segment costs 
+        time proportional to its length rather than to the length of the remaining data.
+        """
+        xv = x.to_numpy(dtype=float)
+        yv = y.to_numpy(dtype=float)
+        n = len(xv)
+        w = window_size
+
+        breakpoints = []
+        segments = []
+        i = 0
+        j = w
+        prev_pred = 0
+        timing = self._counters is not None
+        tests = advances = rejected = 0
+        fit_seconds = test_seconds = 0.0
+
+        if j + w <= n:
+            right_sums = self._right_window_sums(xv, yv, w)
+        while j + w <= n:
+            # Candidates are j, ..., stop - 1
+            size = 4*w
+            while True:
+                stop = min(j + size, n - w + 1)
+                if timing:
+                    start = perf_counter()
+                x0, slopes, anchor_ys, tvalues = self._candidate_tvalues(xv, yv, right_sums, i, j, stop, prev_pred, w)
+                if timing:
+                    fitted = perf_counter()
+                    fit_seconds += fitted - start
+                pvalues = 2*stdtr(w - 1, -np.abs(tvalues))
+                tests += stop - j
+                if timing:
+                    test_seconds += perf_counter() - fitted
+                # If the t-test is significant but less significant than the previous section then return that section
+                q = np.concatenate([[1], pvalues[:-1]])
+                hits = np.flatnonzero((pvalues < sig_level) & (pvalues > q))
+                if len(hits) > 0 or stop == n - w + 1:
+                    break
+                size *= 2
+            # Candidates passed before the breakpoint, or all of them if there is none
+            passed = int(hits[0]) if len(hits) > 0 else stop - j
+            advances += passed
+            rejected += np.count_nonzero(pvalues[:passed] < sig_level)
+            if len(hits) == 0:
+                j = stop
+                break
+            # hits[0] > 0 as q is 1 for the first candidate
+            k = int(hits[0]) - 1
+            j += k + 1
+            breakpoints.append(j - 2)
+            segments.append((i, j - 1, slopes[k], x0, anchor_ys[k]))
+            prev_pred = anchor_ys[k] + slopes[k]*(xv[j-2] - x0)
+            i = j - 1
+            j = j + w - 1
+
+        self._store_counters(2*tests, tests, advances, len(breakpoints), rejected, fit_seconds, test_seconds)
+        return self._collect_results(x, y, breakpoints, segments, i, j, prev_pred, return_models, normality_test)
+
+    def _segment_galloping(self,
+                           x: pd.Series,
+                           y: pd.Series,
+                           window_size: int,
+                           sig_level: float,
+                           return_models: bool,
+                           normality_test: bool):
+        """Apply segmentation procedure with a coarse-to-fine search for the next breakpoint; see segment for 
+        arguments and return values.
+
+        While p-values stay above far_factor*sig_level the step between tested candidates doubles, up to max_step. 
+        Once a tested p-value comes within far_factor*sig_level, the search goes back to the last candidate tested 
+        and continues one sample at a time, so the stopping rule always compares consecutive p-values. A breakpoint is 
+        missed only if the p-value drops from above far_factor*sig_level to below sig_level and back within one step, 
+        so the breakpoints usually match the other engines but are not guaranteed to. The number of tests performed 
+        and skipped are returned as 'tests' and 'skipped_tests'.
+        """
+        xs = x.to_numpy(dtype=float).tolist()
+        ys = y.to_numpy(dtype=float).tolist()
+        n = len(xs)
+        w = window_size
+        df_right = w - 1
+        far = self.far_factor*sig_level
+        max_step = self.max_step
+
+        breakpoints = []
+        segments = []
+        tests = 0
+        skipped_tests = 0
+        advances = rejected = 0
+        timing = self._counters is not None
+        fit_seconds = test_seconds = 0.0
+        i = 0
+        j = w
+        prev_pred = 0
+
+        if j + w <= n:
+            right_sums = [sums.tolist() for sums in self._right_window_sums(np.array(xs), np.array(ys), w)]
+        while j + w <= n:
+            if i == 0:
+                x0, y0 = xs[0], ys[0]
+            else:
+                x0, y0 = xs[i-1], prev_pred
+            # Left segment sums over [i, base), relative to the anchor point, where base is the candidate after the 
+            # last one tested
+            s_a = s_d = s_aa = s_ad = 0.0
+            for k in range(i, j):
+                a = xs[k] - x0
+                d = ys[k] - y0
+                s_a += a
+                s_d += d
+                s_aa += a*a
+                s_ad += a*d
+            base = j
+            q = 1
+            step = 1
+            hit = False
+            while base + w <= n:
+                if timing:
+                    start = perf_counter()
+                candidate = min(base + step - 1, n - w)
+                # Left segment sums over [i, candidate)
+                c_a, c_d, c_aa, c_ad = s_a, s_d, s_aa, s_ad
+                for k in range(base, candidate):
+                    a = xs[k] - x0
+                    d = ys[k] - y0
+                    c_a += a
+                    c_d += d
+                    c_aa += a*a
+                    c_ad += a*d
+                # Left segment regression
+                if i == 0:
+                    # Regression with constant, in coordinates centred on the first point
+                    m = candidate
+                    slope = (c_ad - c_a*c_d/m)/(c_aa - c_a*c_a/m)
+                    anchor_y = y0 + (c_d - slope*c_a)/m
+                else:
+                    # Regression forced through previous section
+                    slope = c_ad/c_aa
+                    anchor_y = y0
+                final_pred = anchor_y + slope*(xs[candidate] - x0)
+                # Right window regression forced through intersection
+                s_u, s_uu, s_uy, s_y, s_yy = (sums[candidate] for sums in right_sums)
+                s_uv = s_uy - final_pred*s_u
+                s_vv = s_yy - 2*final_pred*s_y + w*final_pred*final_pred
+                right_slope = s_uv/s_uu
+                ssr = max(s_vv - right_slope*s_uv, 0.0)
+                if timing:
+                    fitted = perf_counter()
+                    fit_seconds += fitted - start
+                # Perform t-test
+                tvalue = np.float64(right_slope - slope)/np.sqrt(ssr/df_right/s_uu)
+                pvalue = 2*stdtr(df_right, -abs(tvalue))
+                tests += 1
+                if timing:
+                    test_seconds += perf_counter() - fitted
+                if candidate > base and not pvalue > far:
+                    # Close to significance after a step: go back and test every candidate after the last one tested
+                    step = 1
+                    continue
+                # If the t-test is significant but less significant than the previous section then return that section.
+                # Only possible after a step of one, as a p-value after a longer step is above far.
+                if pvalue < sig_level and pvalue > q:
+                    hit = True
+                    break
+                # Move past the candidate
+                rejected += pvalue < sig_level
+                advances += candidate + 1 - base
+                skipped_tests += candidate - base
+                a = xs[candidate] - x0
+                d = ys[candidate] - y0
+                s_a, s_d, s_aa, s_ad = c_a + a, c_d + d, c_aa + a*a, c_ad + a*d
+                base = candidate + 1
+                q = pvalue
+                prev_slope = slope
+                prev_anchor_y = anchor_y
+                step = min(2*step, max_step) if pvalue > far else 1
+            if not hit:
+                j = base
+                break
+            j = candidate
+            breakpoints.append(j - 2)
+            segments.append((i, j - 1, prev_slope, x0, prev_anchor_y))
+            prev_pred = prev_anchor_y + prev_slope*(xs[j-2] - x0)
+            i = j - 1
+            j = j + w - 1
+
+        self._store_counters(2*tests, tests, advances, len(breakpoints), rejected, fit_seconds, test_seconds)
+        return_dict = self._collect_results(x, y, breakpoints, segments, i, j, prev_pred, return_models, 
+                                            normality_test)
+        return_dict['tests'] = tests
+        return_dict['skipped_tests'] = skipped_tests
+        return return_dict
+
+    def _segment_pelt(self,
+                      x: pd.Series,
+                      y: pd.Series,
+                      window_size: int,
+                      sig_level: float,
+                      return_models: bool,
+                      normality_test: bool):
+        """Apply optimal partitioning with PELT pruning, then fit a continuous piecewise linear model with knots at 
+        the breakpoints; see segment for arguments and return values.
+
+        The breakpoints minimise the sum over segments of the squared residuals of an independent least squares line, 
+        not joined to its neighbours, plus self.penalty per breakpoint, with segments of at least window_size points. 
+        sig_level is not used. Candidates 
+        that can no longer start the last segment of an optimal partition are pruned, so the run time is close to 
+        linear when the number of breakpoints grows with the length of the data. The segments are then refitted 
+        jointly as a linear spline with knots at the breakpoints, so each segment is forced through the end of the 
+        previous one as in the sequential procedure. The continuity only applies to this refit, not to the cost 
+        minimised, which is why the 'bic' penalty counts the parameters of independent lines.
+        """
+        xs = x.to_numpy(dtype=float)
+        ys = y.to_numpy(dtype=float)
+        n = len(xs)
+        min_size = max(window_size, 2)
+        penalty = self._bic_penalty(ys) if self.penalty == 'bic' else float(self.penalty)
+
+        # best[t] is the minimum cost of [0, t) and last[t] the start of its last segment
+        best = np.full(n + 1, np.inf)
+        best[0] = -penalty
+        last = np.zeros(n + 1, dtype=int)
+        # Candidate starts of the last segment with their sums over [start, t) of a, d, a^2, ad, d^2, where 
+        # a = x - x[start] and d = y - y[start]. The first size entries of the buffers are in use.
+        starts = np.zeros(n + 1, dtype=int)
+        sums = np.zeros((5, n + 1))
+        size = 0
+        fits = 0
+        start_time = perf_counter()
+        for t in range(min_size, n + 1):
+            # Add point t - 1 to the segments of the existing candidates
+            a = xs[t-1] - xs[starts[:size]]
+            d = ys[t-1] - ys[starts[:size]]
+            sums[:, :size] += (a, d, a*a, a*d, d*d)
+            # The segment [t - min_size, t) becomes long enough to be the last segment
+            start = t - min_size
+            if best[start] < np.inf:
+                a = xs[start:t] - xs[start]
+                d = ys[start:t] - ys[start]
+                starts[size] = start
+                sums[:, size] = a.sum(), d.sum(), a@a, a@d, d@d
+                size += 1
+            # Squared residuals of the least squares line on [start, t) for each candidate
+            s_a, s_d, s_aa, s_ad, s_dd = sums[:, :size]
+            m = t - starts[:size]
+            s_ad_c = s_ad - s_a*s_d/m
+            costs = best[starts[:size]] + np.maximum(s_dd - s_d*s_d/m - s_ad_c*s_ad_c/(s_aa - s_a*s_a/m), 0)
+            fits += size
+            k = np.argmin(costs)
+            best[t] = costs[k] + penalty
+            last[t] = starts[k]
+            # Prune candidates that cannot beat the best partition of [0, t) however the data continues
+            keep = np.flatnonzero(costs <= best[t])
+            if len(keep) < size:
+                starts[:len(keep)] = starts[keep]
+                sums[:, :len(keep)] = sums[:, keep]
+                size = len(keep)
+
+        # Segment starts of the optimal partition, from the end back
+        boundaries = []
+        t = n
+        while t > 0 and np.isfinite(best[t]) and last[t] > 0:
+            t = last[t]
+            boundaries.append(t)
+        boundaries = boundaries[::-1]
+        # The breakpoint is the last point of each segment, which is the knot shared with the next segment
+        breakpoints = [int(start) - 1 for start in boundaries]
+        segments = self._continuous_fit(xs, ys, [0] + boundaries + [n]) if n >= 2 else []
+        self._store_counters(fits + 1, 0, max(n - min_size + 1, 0), len(breakpoints), 0, perf_counter() - start_time, 
+                             0.0)
+
+        return_dict = self._collect_results(x, y, breakpoints, segments, n, n, 0, return_models, normality_test)
+        return_dict['penalty'] = penalty
+        return return_dict
+
+    def _bic_penalty(self, ys: np.ndarray):
+        """BIC penalty per breakpoint of the cost minimised by the 'pelt' engine, in units of squared residuals.
+
+        The cost fits an independent line to each segment, so each breakpoint adds three parameters, its location and 
+        the slope and intercept of the new segment. The noise variance is estimated from the median absolute second 
+        difference of y, which is not affected by changes in slope.
+
+        Args:
+            ys (np.ndarray of float): y values.
+        Returns:
+            float: 3*variance*log(n).
+        """
+        if len(ys) < 3:
+            return 0.0
+        # Second differences of independent noise have variance 6*variance
+        sigma = np.median(np.abs(np.diff(ys, 2)))/0.6745/np.sqrt(6)
+        return 3*sigma*sigma*np.log(len(ys))
+
+    def _continuous_fit(self, xs: np.ndarray, ys: np.ndarray, boundaries: list):
+        """Least squares linear spline with a knot at the first point, the last point of each segment and the last 
+        point of the data.
+
+        Args:
+            xs (np.ndarray of float): x values, increasing.
+            ys (np.ndarray of float): y values.
+            boundaries (list of int): Start of each segment followed by the length of the data.
+        Returns:
+            list of tuple: (start, stop, slope, anchor_x, anchor_y) for each segment, as used by _collect_results.
+        """
+        n = len(xs)
+        starts = np.array(boundaries[:-1])
+        knot_index = np.concatenate([[0], np.array(boundaries[1:]) - 1])
+        knots = xs[knot_index]
+        # Each point is a weighted average of the values at the knots either side of its segment
+        segment = np.repeat(np.arange(len(starts)), np.diff(boundaries))
+        lam = (xs - knots[segment])/(knots[segment + 1] - knots[segment])
+        # Tridiagonal normal equations for the values at the knots
+        diag = np.bincount(segment, (1 - lam)**2, len(knots)) + np.bincount(segment + 1, lam**2, len(knots))
+        off = np.bincount(segment, (1 - lam)*lam, len(knots) - 1)
+        rhs = np.bincount(segment, (1 - lam)*ys, len(knots)) + np.bincount(segment + 1, lam*ys, len(knots))
+        values = solveh_banded(np.array([np.concatenate([[0], off]), diag]), rhs)
+        slopes = np.diff(values)/np.diff(knots)
+        return [(int(starts[k]), int(boundaries[k+1]), slopes[k], knots[k], values[k]) for k in range(len(starts))]
+
+    def _right_window_sums(self, xv: np.ndarray, yv: np.ndarray, window_size: int):
+        """Sums over the right window [j, j + window_size) for every j, with u = x - x[j].
+
+        Args:
+            xv (np.ndarray of float): x values.
+            yv (np.ndarray of float): y values, or one row of y values per channel.
+            window_size (int): Size for window.
+        Returns:
+            tuple of np.ndarray: (sum u, sum u^2, sum uy, sum y, sum y^2), each indexed by j. The sums involving y have 
+            one row per channel if yv does.
+        """
+        m = len(xv) - window_size + 1
+        s_u, s_uu = np.zeros((2, m))
+        s_uy, s_y, s_yy = np.zeros((3,) + yv[..., :m].shape)
+        for k in range(window_size):
+            u = xv[k:k+m] - xv[:m]
+            y_k = yv[..., k:k+m]
+            s_u += u
+            s_uu += u*u
+            s_uy += u*y_k
+            s_y += y_k
+            s_yy += y_k*y_k
+        return s_u, s_uu, s_uy, s_y, s_yy
+
+    def _candidate_tvalues(self,
+                           xv: np.ndarray,
+                           yv: np.ndarray,
+                           right_sums: tuple,
+                           i: int,
+                           j: int,
+                           stop: int,
+                           prev_pred: float,
+                           window_size: int):
+        """Left segment fits and right window t-statistics for the candidates j, ..., stop - 1 with left anchor i.
+
+        Args:
+            xv (np.ndarray of float): x values.
+            yv (np.ndarray of float): y values.
+            right_sums (tuple of np.ndarray): Output of _right_window_sums.
+            i (int): Index of the first point of the left segment.
+            j (int): First candidate.
+            stop (int): Index after the last candidate.
+            prev_pred (float): Prediction of the previous segment at i - 1. Unused if i is 0.
+            window_size (int): Size for window.
+        Returns:
+            tuple: (anchor_x (float), slopes (np.ndarray), anchor_ys (np.ndarray), tvalues (np.ndarray)). The left 
+            segment predictions for candidate j + k are anchor_ys[k] + slopes[k]*(x - anchor_x). The t-statistics 
+            have window_size - 1 degrees of freedom.
+        """
+        if i == 0:
+            x0, y0 = xv[0], yv[0]
+        else:
+            x0, y0 = xv[i-1], prev_pred
+        # Left segment sums over [i, j + k) for each candidate, relative to the anchor point
+        a = xv[i:stop-1] - x0
+        d = yv[i:stop-1] - y0
+        s_a = np.cumsum(a)[j-1-i:]
+        s_d = np.cumsum(d)[j-1-i:]
+        s_aa = np.cumsum(a*a)[j-1-i:]
+        s_ad = np.cumsum(a*d)[j-1-i:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if i == 0:
+                # Regression with constant, in coordinates centred on the first point
+                m = np.arange(j, stop)
+                slopes = (s_ad - s_a*s_d/m)/(s_aa - s_a*s_a/m)
+                anchor_ys = y0 + (s_d - slopes*s_a)/m
+            else:
+                # Regression forced through previous section
+                slopes = s_ad/s_aa
+                anchor_ys = np.full(len(slopes), y0)
+            final_preds = anchor_ys + slopes*(xv[j:stop] - x0)
+            # Right window regressions forced through intersection
+            s_u, s_uu, s_uy, s_y, s_yy = map(lambda s: s[j:stop], right_sums)
+            s_uv = s_uy - final_preds*s_u
+            s_vv = s_yy - 2*final_preds*s_y + window_size*final_preds*final_preds
+            right_slopes = s_uv/s_uu
+            ssr = np.maximum(s_vv - right_slopes*s_uv, 0)
+            tvalues = (right_slopes - slopes)/np.sqrt(ssr/(window_size - 1)/s_uu)
+        return x0, slopes, anchor_ys, tvalues
+
+    def _store_counters(self,
+                        fits: int,
+                        tests: int,
+                        advances: int,
+                        accepted: int,
+                        rejected: int,
+                        fit_seconds: float,
+                        test_seconds: float):
+        """Store the counters of an engine run, if segment was called with return_counters. See segment for the 
+        meaning of each counter. The fit of the final section is counted by _collect_results.
+        """
+        if self._counters is not None:
+            self._counters.update(fits=int(fits), tests=int(tests), advances=int(advances), accepted=int(accepted), 
+                                  rejected=int(rejected), fit_seconds=fit_seconds, test_seconds=test_seconds)
+
+    def _collect_results(self,
+                         x: pd.Series,
+                         y: pd.Series,
+                         breakpoints: list,
+                         segments: list,
+                         i: int,
+                         j: int,
+                         prev_pred: float,
+                         return_models: bool,
+                         normality_test: bool):
+        """Fit the final section of data and build the return dictionary from the segments found.
+
+        Args:
+            x (pd.Series of float): x values.
+            y (pd.Series of float): y values.
+            breakpoints (list of int): List of breakpoints for segments.
+            segments (list of tuple): (start, stop, slope, anchor_x, anchor_y) for each segment closed by a breakpoint. 
+            Predictions of a segment are anchor_y + slope*(x - anchor_x).
+            i (int): Index of the first point of the final section.
+            j (int): Value of j when the search stopped.
+            prev_pred (float): Prediction of the last segment at i - 1.
+            return_models (bool): Indicates whether to return the models for each segment.
+            normality_test (bool): Indicates whether to return normality test results for residuals of regressions.
+        Returns:
+            dict: See segment.
+        """
+        xs = x.to_numpy(dtype=float)
+        ys = y.to_numpy(dtype=float)
+        n = len(xs)
         # Build model on final section of data
-        if j<len(x):
-            final_model = sm.OLS(y[i:] - prev_pred, x[i:]-x[i-1])
-            final_results = final_model.fit(use_t=True)
-            predictions = np.append(predictions, final_results.predict() + prev_pred)
-            if return_models:
-                model_results.append(final_results)
-        
+        if j < n:
+            if self._counters is not None and 'fits' in self._counters:
+                self._counters['fits'] += 1
+            if i == 0:
+                # Regression with constant, in coordinates centred on the first point
+                a = xs - xs[0]
+                d = ys - ys[0]
+                slope = np.dot(a - a.mean(), d)/np.dot(a - a.mean(), a)
+                segments.append((0, n, slope, xs[0], ys[0] + d.mean() - slope*a.mean()))
+            else:
+                a = xs[i:] - xs[i-1]
+                slope = np.dot(a, ys[i:] - prev_pred)/np.dot(a, a)
+                segments.append((i, n, slope, xs[i-1], prev_pred))
+
+        model_results = np.zeros(len(segments), dtype=segment_dtype)
+        for k, (start, stop, slope, anchor_x, anchor_y) in enumerate(segments):
+            model_results[k] = (start, stop, slope, anchor_y, 0, stop - start, anchor_x)
+        predictions = predict_segments(xs, model_results)
+        # Residual variance, the first segment has a constant so loses an extra degree of freedom
+        resid = ys[:len(predictions)] - predictions
+        if len(model_results) > 0:
+            df_resid = model_results['nobs'] - 1 - (model_results['start'] == 0)
+            model_results['scale'] = np.add.reduceat(resid*resid, model_results['start'])/df_resid
+
         return_dict = {'predictions': predictions, 'breakpoints': breakpoints}
         if return_models:
             return_dict['model_results'] = model_results
 
         if normality_test:
-            return_dict['mean_normal_p'] = shapiro_total_p/len(model_results)
-            return_dict['sig_normal_p'] = shapiro_sig_count/len(model_results)
+            moments = residual_moments(resid, model_results)
+            return_dict['residual_moments'] = moments
+            # Only segments closed by a breakpoint are counted
+            jb_p = moments['jb_p'][:len(breakpoints)]
+            return_dict['mean_normal_p'] = np.mean(jb_p) if len(jb_p) > 0 else np.nan
+            return_dict['sig_normal_p'] = np.mean(jb_p < 0.01) if len(jb_p) > 0 else np.nan
+
+        return return_dict
 
-        return return_dict
\ No newline at end of file
+    # Engine name -> function implementing the segmentation procedure
+    engines = {'statsmodels': _segment_statsmodels,
+               'incremental': _segment_incremental,
+               'vectorized': _segment_vectorized,
+               'galloping': _segment_galloping,
+               'pelt': _segment_pelt}
@@ -0,0 +1,191 @@
+import numpy as np
+from collections import deque
+from scipy.special import stdtr
+from linear_segmentation import segment_dtype
+
+class OnlineLinearSegmenter:
+    """
+    Streaming version of the linear segmentation procedure of LinearSegmentation.segment, for live data.
+
+    Samples are added one at a time (or in batches) and breakpoints are emitted as soon as they are confirmed: 
+    breakpoint b is returned by the update that adds sample b + window_size + 1, so window_size + 2 samples from the 
+    breakpoint on, a latency of window_size + 1 sample intervals. The breakpoints are the same as those of 
+    LinearSegmentation.segment on the whole series. The left segment is kept as running sums and only the last 
+    2*window_size + 2 samples are stored, so memory use does not grow with session length. The models of closed 
+    segments are only kept, until pop_segments or finish is called, if keep_segments is set.
+    """
+    def __init__(self, window_size: int = 10, sig_level: float = 0.01, keep_segments: bool = False):
+        """Initialiser function for class.
+
+        Args:
+            window_size (int, optional): Size for window. Defaults to 10.
+            sig_level (float, optional): Significance level for statistical difference. Defaults to 0.01.
+            keep_segments (bool, optional): Indicate whether to keep the model of each closed segment for 
+            pop_segments and finish. Their number grows with session length. Defaults to False.
+        """
+        self.window_size = window_size
+        self.sig_level = sig_level
+        self.keep_segments = keep_segments
+        # Last samples as (index, x, y)
+        self.buffer = deque(maxlen=2*window_size + 2)
+        # Number of samples seen
+        self.n = 0
+        self.i = 0
+        self.j = window_size
+        self.q = 1
+        self.prev_pred = 0
+        # Anchor point of the left segment and its sums over [i, j): sum a, sum d, sum a^2, sum ad, sum d^2, with
+        # a = x - anchor_x and d = y - anchor_y
+        self.anchor = None
+        self.left = None
+        # Slope, anchor_y and scale of the left segment fit at the previous step
+        self.prev_fit = None
+        # Closed segments not yet returned by pop_segments
+        self.segments = []
+
+    def _sample(self, index: int):
+        """(x, y) of a sample still in the buffer.
+        """
+        first = self.buffer[0][0]
+        return self.buffer[index - first][1:]
+
+    def _reset_left(self):
+        """Set the anchor point and recompute the left segment sums over [i, j) from the buffer.
+        """
+        if self.i == 0:
+            self.anchor = self._sample(0)
+        else:
+            self.anchor = (self._sample(self.i - 1)[0], self.prev_pred)
+        self.left = [0.0]*5
+        for k in range(self.i, self.j):
+            self._add_left(*self._sample(k))
+
+    def _add_left(self, x: float, y: float):
+        a = x - self.anchor[0]
+        d = y - self.anchor[1]
+        s = self.left
+        s[0] += a
+        s[1] += d
+        s[2] += a*a
+        s[3] += a*d
+        s[4] += d*d
+
+    def _fit(self, s: list, count: int, constant: bool):
+        """Fit the left segment from its sums.
+
+        Args:
+            s (list of float): Sums over the segment, as self.left.
+            count (int): Number of points in the segment.
+            constant (bool): Whether the regression has a constant (first segment) or is forced through the anchor.
+        Returns:
+            tuple: (slope, anchor_y, scale) with predictions anchor_y + slope*(x - anchor_x).
+        """
+        s_a, s_d, s_aa, s_ad, s_dd = s
+        if constant:
+            s_aa_c = s_aa - s_a*s_a/count
+            s_ad_c = s_ad - s_a*s_d/count
+            slope = s_ad_c/s_aa_c
+            ssr = s_dd - s_d*s_d/count - slope*s_ad_c
+            return slope, self.anchor[1] + (s_d - slope*s_a)/count, ssr/(count - 2)
+        slope = s_ad/s_aa
+        return slope, self.anchor[1], (s_dd - slope*s_ad)/(count - 1)
+
+    def _record(self, start: int, end: int, slope: float, anchor_y: float, scale: float):
+        return (start, end, slope, anchor_y, scale, end - start, self.anchor[0])
+
+    def update(self, x: float, y: float):
+        """Add a sample.
+
+        Args:
+            x (float): x value of the sample.
+            y (float): y value of the sample.
+        Returns:
+            list of int: Breakpoints confirmed by this sample, as indices of the samples seen so far.
+        """
+        self.buffer.append((self.n, float(x), float(y)))
+        self.n += 1
+        w = self.window_size
+        new_breakpoints = []
+        while self.j + w <= self.n:
+            if self.left is None:
+                self._reset_left()
+            i, j = self.i, self.j
+            slope, anchor_y, scale = self._fit(self.left, j - i, i == 0)
+            x_j = self._sample(j)[0]
+            final_pred = anchor_y + slope*(x_j - self.anchor[0])
+            # Right window regression forced through intersection
+            s_uu = s_uv = s_vv = 0.0
+            for k in range(j, j + w):
+                x_k, y_k = self._sample(k)
+                u = x_k - x_j
+                v = y_k - final_pred
+                s_uu += u*u
+                s_uv += u*v
+                s_vv += v*v
+            right_slope = s_uv/s_uu
+            ssr = max(s_vv - right_slope*s_uv, 0.0)
+            # Perform t-test
+            tvalue = np.float64(right_slope - slope)/np.sqrt(ssr/(w - 1)/s_uu)
+            pvalue = 2*stdtr(w - 1, -abs(tvalue))
+            # If the t-test is significant but less significant than the previous section then return that section
+            if pvalue < self.sig_level and pvalue > self.q:
+                prev_slope, prev_anchor_y, prev_scale = self.prev_fit
+                new_breakpoints.append(j - 2)
+                if self.keep_segments:
+                    self.segments.append(self._record(i, j - 1, prev_slope, prev_anchor_y, prev_scale))
+                self.prev_pred = prev_anchor_y + prev_slope*(self._sample(j - 2)[0] - self.anchor[0])
+                self.i = j - 1
+                self.j = j + w - 1
+                self.q = 1
+                self.left = None
+            else:
+                self.prev_fit = (slope, anchor_y, scale)
+                self._add_left(*self._sample(j))
+                self.j += 1
+                self.q = pvalue
+        return new_breakpoints
+
+    def update_batch(self, xs, ys):
+        """Add several samples.
+
+        Args:
+            xs (iterable of float): x values of the samples.
+            ys (iterable of float): y values of the samples.
+        Returns:
+            list of int: Breakpoints confirmed by these samples.
+        """
+        new_breakpoints = []
+        for x, y in zip(xs, ys):
+            new_breakpoints += self.update(x, y)
+        return new_breakpoints
+
+    def pop_segments(self):
+        """Models of the segments closed since the last call.
+
+        Returns:
+            np.array of segment_dtype: Record array of the model for each closed segment, as returned by
+            LinearSegmentation.segment. Empty unless keep_segments is set.
+        """
+        segments = np.array(self.segments, dtype=segment_dtype)
+        self.segments = []
+        return segments
+
+    def finish(self):
+        """Fit the final section of data once no more samples will be added, as LinearSegmentation.segment does.
+
+        Returns:
+            np.array of segment_dtype: Record array of the model for each segment closed since the last call to
+            pop_segments, if keep_segments is set, and of the final section.
+        """
+        if self.j < self.n and self.n >= 2:
+            if self.left is None:
+                # Fewer than window_size samples since the last breakpoint
+                self.j = self.i
+                self.left = [0.0]*5
+                self.anchor = self._sample(0) if self.i == 0 else (self._sample(self.i - 1)[0], self.prev_pred)
+            # At most window_size - 1 samples are left after j, all still in the buffer
+            for k in range(self.j, self.n):
+                self._add_left(*self._sample(k))
+            self.j = self.n
+            self.segments.append(self._record(self.i, self.n, *self._fit(self.left, self.n - self.i, self.i == 0)))
+        return self.pop_segments()
@@ -36,8 +36,8 @@ def plot_prediction(time: pd.Series,
         regressions. Defaults to False. 
     Returns:
         dict: {'breakpoints' (list of int): List of all breakpoints,
-               'model_results' (list of RegressionResults): List of models for each segment. Requires return_models to 
-               be returned}
+               'model_results' (np.array of segment_dtype): Record array of the model for each segment, with start and 
+               end indexing the whole of the data. Requires return_models to be returned}
     """    
     assert(len(time) == len(y))
 
@@ -65,7 +65,10 @@ def plot_prediction(time: pd.Series,
         all_breakpoints += [prev_break] + list(map(lambda x: x + prev_break, breakpoints))
         all_breakpoints += [prev_break + len(predictions)]
         if return_models:
-            model_results += segmentation_dict['model_results']
+            block_results = segmentation_dict['model_results'].copy()
+            block_results['start'] += prev_break
+            block_results['end'] += prev_break
+            model_results.append(block_results)
         if normality_test:
             mean_normal_p.append(segmentation_dict['mean_normal_p'])
             sig_normal_p.append(segmentation_dict['sig_normal_p'])
@@ -80,11 +83,11 @@ def plot_prediction(time: pd.Series,
         plt.plot(time[prev_break:prev_break + len(predictions)], predictions, color = prediction_line_color)
         prev_break = _break 
     if normality_test:
-        print(f'Mean p-value for normality tests: {np.mean(mean_normal_p)}')
-        print(f'Mean percentage of segments with significantly non-normal residuals {np.mean(sig_normal_p)}')
+        print(f'Mean p-value for normality tests: {np.nanmean(mean_normal_p)}')
+        print(f'Mean percentage of segments with significantly non-normal residuals {np.nanmean(sig_normal_p)}')
     print(pearsonr(np.array(lengths), np.array(lengths2)))
     if return_models:
-        return {'breakpoints': all_breakpoints, 'model_results': model_results}
+        return {'breakpoints': all_breakpoints, 'model_results': np.concatenate(model_results)}
     else:
         return {'breakpoints': all_breakpoints}
 
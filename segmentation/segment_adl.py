@@ -3,43 +3,83 @@ import os
 import git
 import pandas as pd
 import json
+import time
+import argparse
 from summarize_segments import summarize
+from batch import run_batch, print_timing, file_id
+from instrumentation import configure, span, file_span
+
+def segment_adl_file(file_name: str,
+                     group: str = 'young/halves',
+                     engine: str = 'statsmodels'):
+    """Segment one ADL file and save its breakpoints and summarization.
+
+    Args:
+        file_name (str): Name of the file in input_data/adl/group.
+        group (str, optional): Folder of the file in input_data/adl: 'young', 'old', 'young/halves' or 'old/halves'.
+        Defaults to 'young/halves'.
+        engine (str, optional): LinearSegmentation engine to use. Defaults to 'statsmodels'.
+    Returns:
+        dict: Seconds spent in each stage.
+    """
+    repo = git.Repo('.', search_parent_directories=True)
+    file_path = os.path.join(repo.working_tree_dir, 'input_data', 'adl', *group.split('/'))
+    breakpoint_file_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_breakpoints')
+    # 'y' for young, 'o' for old
+    suffix = group[0]
+    timings = {}
+
+    with file_span(f'adl/{group}/{file_name}'):
+        with span('load', timings=timings) as record:
+            df = pd.read_csv(os.path.join(file_path, file_name))
+            record['rows'] = len(df)
+
+        with span('segment', timings=timings) as record:
+            time_exp = pd.Series([i/120 for i in range(len(df))])
+            time_exp.name = 'timeExp'
+            return_dict = LinearSegmentation(engine).segment(time_exp, df['speed_clean'], sig_level=0.0001,
+                                                             return_models=True)
+            record['rows'] = len(df)
+
+        with span('summarize', timings=timings) as record:
+            df['timeExp'] = time_exp
+            breakpoints = [0]+return_dict['breakpoints']+[len(df)-1]
+            summarize(df, breakpoints, 'speed_clean', return_dict['model_results'],
+                      f'summarize_{file_id(file_name)}_{suffix}.csv')
+            record['rows'] = len(df)
+
+        with span('write', timings=timings):
+            breakpoint_file_name = os.path.join(breakpoint_file_path, f'{file_id(file_name)}_{suffix}.json')
+            with open(breakpoint_file_name, 'w') as breakpoint_file:
+                json.dump(return_dict['breakpoints'], breakpoint_file)
+
+    return timings
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Segment ADL files.')
+    parser.add_argument('groups', nargs='*', default=['young/halves', 'old/halves'],
+                        help="Folders of input_data/adl to segment: 'young', 'old', 'young/halves' or 'old/halves'.")
+    parser.add_argument('--engine', default='statsmodels')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('--trace', default=None, help='File to append JSON lines timing records of each stage to.')
+    parser.add_argument('--profile', default=None, 
+                        help='Directory to write a cProfile stats file for each file to.')
+    parser.add_argument('--trace-memory', action='store_true', 
+                        help='Also write the largest memory allocation sites of each file to the profile directory.')
+    args = parser.parse_args()
 
     repo = git.Repo('.', search_parent_directories=True)
+    configure(args.trace, args.profile, args.trace_memory)
     file_path = os.path.join(repo.working_tree_dir, 'input_data', 'adl')
 
-    breakpoint_file_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_breakpoints')
+    tasks = []
+    for group in args.groups:
+        for file_name in sorted(os.listdir(os.path.join(file_path, *group.split('/')))):
+            # Skip the halves folder inside young and old
+            if not file_name.endswith('.csv'):
+                continue
+            tasks.append({'file_name': file_name, 'group': group, 'engine': args.engine})
 
-    for file_name in os.listdir(os.path.join(file_path, 'young', 'halves')):
-        if file_name == 'halves':
-            continue
-        df = pd.read_csv(os.path.join(file_path, 'young', 'halves',  file_name))
-        time = pd.Series([i/120 for i in range(len(df))])
-        time.name = 'timeExp'
-        return_dict = LinearSegmentation().segment(time, df['speed_clean'], sig_level=0.0001, return_models=True)
-        df['timeExp'] = time
-        breakpoints = [0]+return_dict['breakpoints']+[len(df)-1]
-        summarize(df, breakpoints, 'speed_clean', return_dict['model_results'],
-                  f'summarize_{file_name.strip(".csv")}_y.csv')
-        breakpoint_file_name = os.path.join(breakpoint_file_path, file_name.strip('.csv')+'_y.json')
-
-        with open(breakpoint_file_name, 'w') as breakpoint_file:
-            json.dump(return_dict['breakpoints'], breakpoint_file)
-    
-    for file_name in os.listdir(os.path.join(file_path, 'old', 'halves')):
-        if file_name == 'halves':
-            continue
-        df = pd.read_csv(os.path.join(file_path, 'old', 'halves', file_name))
-        time = pd.Series([i/120 for i in range(len(df))])
-        time.name = 'timeExp'
-        return_dict = LinearSegmentation().segment(time, df['speed_clean'], sig_level=0.0001, return_models=True)
-        df['timeExp'] = time
-        breakpoints = [0]+return_dict['breakpoints']+[len(df)-1]
-        summarize(df, breakpoints , 'speed_clean', return_dict['model_results'],
-                  f'summarize_{file_name.strip(".csv")}_o.csv')
-        breakpoint_file_name = os.path.join(breakpoint_file_path, file_name.strip('.csv')+'_o.json')
-
-        with open(breakpoint_file_name, 'w') as breakpoint_file:
-            json.dump(return_dict['breakpoints'], breakpoint_file)
\ No newline at end of file
+    total_start = time.perf_counter()
+    results = run_batch(segment_adl_file, tasks, jobs=args.jobs)
+    print_timing(results, time.perf_counter() - total_start)
@@ -2,122 +2,324 @@ import git
 import pandas as pd
 import numpy as np
 import os
-from linear_segmentation import LinearSegmentation
+from linear_segmentation import LinearSegmentation, chunk_bounds, stitch_chunks
 from summarize_segments import summarize
-import sys
+from batch import run_batch, print_timing, file_id
+from instrumentation import configure, span, file_span
+import argparse
 import time
 import json
+from concurrent.futures import ProcessPoolExecutor
 
 """
 Segments all files of a given object/variable type (e.g. controller speed) and saves breakpoints and summarization of
 segmentation.
 """
 
+def _segment_block(time: pd.Series,
+                   y: pd.Series,
+                   sig_level: float,
+                   window_size: int,
+                   return_models: bool,
+                   engine: str):
+    """Segment one larger section of data. Module level so it can be run in a worker process.
+    """
+    segmentation = LinearSegmentation(engine)
+    if isinstance(y, pd.DataFrame):
+        return segmentation.segment_channels(x = time, y = y, window_size = window_size, sig_level = sig_level, 
+                                             return_models=return_models)
+    return segmentation.segment(x = time, y = y, window_size = window_size, sig_level = sig_level, 
+                                return_models=return_models)
+
+def _merge_blocks(time: pd.Series,
+                  y: pd.Series,
+                  blocks: list,
+                  tasks: list,
+                  task_dicts: list,
+                  return_models: bool,
+                  chunk_size: int):
+    """Stitch the chunks of each larger section and merge the sections into the return dictionary of segment_total.
+
+    Args:
+        time (pd.Series): Time data.
+        y (pd.Series): y data that was segmented.
+        blocks (list of tuple): (start, stop) of each larger section.
+        tasks (list of tuple): (section, start, stop) of each section or chunk that was segmented.
+        task_dicts (list of dict): Segmentation of each task.
+        return_models (bool): Indicates whether to return the models for each segment.
+        chunk_size (int): Chunk size used, or None.
+    Returns:
+        dict: See segment_total.
+    """
+    # Stitch chunked sections back together
+    block_dicts = []
+    unsynced_chunks = 0
+    for block, (start, stop) in enumerate(blocks):
+        block_tasks = [(task_start - start, task_stop - start, task_dict) 
+                       for (task_block, task_start, task_stop), task_dict in zip(tasks, task_dicts) 
+                       if task_block == block]
+        if len(block_tasks) == 1:
+            block_dicts.append(block_tasks[0][2])
+        else:
+            block_dicts.append(stitch_chunks(time[start:stop - 1].reset_index(drop=True), 
+                                             y[start:stop - 1].reset_index(drop=True), block_tasks))
+            unsynced_chunks += block_dicts[-1]['unsynced_chunks']
+
+    all_breakpoints = []
+    all_predictions = []
+    if return_models:
+        model_results = []
+    # Merge sections in order, offsetting by the start of each section
+    for (prev_break, _break), segmentation_dict in zip(blocks, block_dicts):
+        predictions, breakpoints = segmentation_dict['predictions'], segmentation_dict['breakpoints']                                         
+        # Add breakpoints to total list of breakpoints
+        all_breakpoints += [prev_break] + list(map(lambda x: x + prev_break, breakpoints))
+        all_breakpoints += [prev_break + len(predictions)]
+        all_predictions.append(predictions)
+        if return_models:
+            block_results = segmentation_dict['model_results'].copy()
+            block_results['start'] += prev_break
+            block_results['end'] += prev_break
+            model_results.append(block_results)
+
+    return_dict = {'breakpoints': all_breakpoints, 'predictions': np.concatenate(all_predictions)}
+    if return_models:
+        return_dict['model_results'] = np.concatenate(model_results)
+    if chunk_size is not None:
+        return_dict['unsynced_chunks'] = unsynced_chunks
+    return return_dict
+
 def segment_total(time: pd.Series,
                     y: pd.Series,
                     cut_time: float = 1,
                     sig_level: float = 0.01,
                     window_size: int = 10,
-                    return_models: bool = False):
+                    return_models: bool = False,
+                    engine: str = 'statsmodels',
+                    jobs: int = 1,
+                    chunk_size: int = None,
+                    overlap: int = 3000):
     """Segment all data
     Args:
         time (pd.Series): Time data.
-        y (pd.Series): y data to segment.
+        y (pd.Series or pd.DataFrame): y data to segment. If a DataFrame, each column is segmented as a separate 
+        channel sharing the time axis, in a single pass with LinearSegmentation.segment_channels.
         cut_time (float, optional): The minimum time between data points at which we break into two larger sections. 
         Defaults to 1.
-        sig_level (float, optional): Significance level. Defaults to 0.01.
-        window_size (int, optional): Window size to use in segmentation. Defaults to 10.
+        sig_level (float or list of float, optional): Significance level, or one per column of y. Defaults to 0.01.
+        window_size (int or list of int, optional): Window size to use in segmentation, or one per column of y. 
+        Defaults to 10.
         return_models (bool, optional): Indicates whether to return the models for each segment. Defaults to False.
+        engine (str, optional): LinearSegmentation engine to use. Not used if y is a DataFrame. Defaults to 
+        'statsmodels'.
+        jobs (int, optional): Number of worker processes to segment the larger sections in. The sections are 
+        independent so the result is the same for any number of jobs. Defaults to 1.
+        chunk_size (int, optional): If given, sections longer than this are segmented in overlapping chunks of at most 
+        chunk_size points, which are run in the same worker pool and stitched back together; see 
+        LinearSegmentation.segment_chunked. Defaults to None.
+        overlap (int, optional): Number of points shared by consecutive chunks. Defaults to 3000.
     Returns:
         dict: {'breakpoints' (list of int): List of all breakpoints,
-               'model_results' (list of RegressionResults): List of models for each segment. Requires return_models to 
-               be returned.}
+               'predictions' (np.array of float): Predictions of fitted models for all sections, concatenated,
+               'model_results' (np.array of segment_dtype): Record array of the model for each segment, with start and 
+               end indexing the whole of the data. Requires return_models to be returned.
+               'unsynced_chunks' (int): Number of chunks that could not be stitched at a common breakpoint. Requires 
+               chunk_size to be returned.}
+        If y is a DataFrame, a dictionary of column name -> the dictionary above for that column.
     """    
     assert(len(time) == len(y))
 
-    all_breakpoints = []
+    # Find all larger sections of data
+    blocks = []
     prev_break = 0
-    if return_models:
-        model_results = []
-    # Loop over all larger sections of data
     for _break in list(time.loc[time.diff() > cut_time].index) + [len(time)]:
-        # Find the current time and y values
-        cur_time = time[prev_break:_break - 1].reset_index(drop=True)
-        cur_y = y[prev_break:_break - 1].reset_index(drop=True)
-        # Segment current data
-        segmentation = LinearSegmentation()
-        segmentation_dict = segmentation.segment(x = cur_time, y = cur_y, window_size = window_size, 
-                                                        sig_level = sig_level, return_models=return_models)
-        predictions, breakpoints = segmentation_dict['predictions'], segmentation_dict['breakpoints']                                         
-        # Add breakpoints to total list of breakpoints
-        all_breakpoints += [prev_break] + list(map(lambda x: x + prev_break, breakpoints))
-        all_breakpoints += [prev_break + len(predictions)]
-        if return_models:
-            model_results += segmentation_dict['model_results']
-
-        prev_break = _break 
-    if return_models:
-        return {'breakpoints': all_breakpoints, 'model_results': model_results}
+        blocks.append((prev_break, _break))
+        prev_break = _break
+    # Split long sections into overlapping chunks, as (section, start, stop) of each task
+    tasks = []
+    for block, (start, stop) in enumerate(blocks):
+        if chunk_size is not None and stop - 1 - start > chunk_size:
+            tasks += [(block, start + chunk_start, start + chunk_stop) 
+                      for chunk_start, chunk_stop in chunk_bounds(stop - 1 - start, chunk_size, overlap)]
+        else:
+            tasks.append((block, start, stop - 1))
+    # Segment each section or chunk, in parallel if jobs > 1. Chunks need their models to be stitched.
+    task_args = ([time[start:stop].reset_index(drop=True) for _, start, stop in tasks],
+                 [y[start:stop].reset_index(drop=True) for _, start, stop in tasks],
+                 [sig_level]*len(tasks), [window_size]*len(tasks), 
+                 [return_models or chunk_size is not None]*len(tasks), [engine]*len(tasks))
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            task_dicts = list(executor.map(_segment_block, *task_args))
     else:
-        return {'breakpoints': all_breakpoints}
+        task_dicts = list(map(_segment_block, *task_args))
 
-if __name__ == "__main__":
-    # input_args = [object, variable]. e.g. [head, speed]
-    input_args = sys.argv[1:]
+    if isinstance(y, pd.DataFrame):
+        return {column: _merge_blocks(time, y[column], blocks, tasks, [task_dict[c] for task_dict in task_dicts], 
+                                      return_models, chunk_size)
+                for c, column in enumerate(y.columns)}
+    return _merge_blocks(time, y, blocks, tasks, task_dicts, return_models, chunk_size)
+
+def _parameters(object_name: str):
+    """Window size, significance level and output file suffix used to segment an object.
+    """
+    if object_name == 'controller':
+        return 10, 10**(-4), 'c'
+    return 20, 10**(-5), 'h'
+
+def _save_segmentation(repo: git.Repo,
+                       df: pd.DataFrame,
+                       col_name: str,
+                       return_dict: dict,
+                       file_name: str,
+                       suffix: str,
+                       window_size: int,
+                       timings: dict):
+    """Save the summarization and breakpoints of a segmented file, adding the time taken to timings.
+    """
+    with span('summarize', timings=timings) as record:
+        summarize(df, return_dict['breakpoints'], col_name, model_results=return_dict['model_results'], 
+                  save_name = f'summarize_{file_id(file_name)}_{suffix}.csv', window_size=window_size)
+        record['rows'] = len(df)
+
+    with span('write', timings=timings):
+        breakpoint_file_name = os.path.join(repo.working_tree_dir, 'outputs', 'breakpoints', 
+                                            f'{file_id(file_name)}_{suffix}.json')
+        with open(breakpoint_file_name, 'w') as breakpoint_file:
+            json.dump(return_dict['breakpoints'], breakpoint_file)
 
-    if len(input_args) == 0:
-        input_args = ['controller', 'speed']
+def segment_file(file_name: str,
+                 object_name: str = 'controller',
+                 variable: str = 'speed',
+                 engine: str = 'statsmodels',
+                 block_jobs: int = 1,
+                 chunk_size: int = None):
+    """Segment one file and save its breakpoints and summarization.
 
+    Args:
+        file_name (str): Name of the file in input_data/object_name/variable, e.g. '1_1_1.csv'.
+        object_name (str, optional): 'controller' or 'head'. Defaults to 'controller'.
+        variable (str, optional): Variable to segment, e.g. 'speed'. Defaults to 'speed'.
+        engine (str, optional): LinearSegmentation engine to use. Defaults to 'statsmodels'.
+        block_jobs (int, optional): Number of worker processes to segment the sections of the file in. Defaults to 1.
+        chunk_size (int, optional): Segment sections longer than this in overlapping chunks, see segment_total. 
+        Defaults to None.
+    Returns:
+        dict: Seconds spent in each stage.
+    """
     repo = git.Repo('.', search_parent_directories = True)
+    timings = {}
 
-    files = os.listdir(os.path.join(repo.working_tree_dir, 'input_data', input_args[0], input_args[1]))
+    with file_span(f'{object_name}/{variable}/{file_name}'):
+        with span('load', timings=timings) as record:
+            file = os.path.join(repo.working_tree_dir, 'input_data', object_name, variable, file_name)
+            df = pd.read_csv(file).reset_index(drop = True)
+            col_name = f'{object_name}_{variable}_clean'
+            df = df[['timeExp', col_name]].copy().dropna().reset_index(drop=True)
+            record['rows'] = len(df)
 
-    total_start = time.time()
-    for file_num, file_name in enumerate(files):
-        print('Progress:', file_num, '/', len(files))
-        file_start = time.time()
-        sub, week, session = file_name.strip('.csv').split('_')
-        file = os.path.join(repo.working_tree_dir, 'input_data', input_args[0], input_args[1], file_name)
-        df = pd.read_csv(file).reset_index(drop = True)
+        window_size, sig_level, suffix = _parameters(object_name)
 
-        col_name = f'{input_args[0]}_{input_args[1]}_clean'
+        with span('segment', timings=timings) as record:
+            return_dict = segment_total(time = df['timeExp'], y = df[col_name], window_size = window_size, 
+                                        sig_level = sig_level, return_models=True, engine=engine, jobs=block_jobs,
+                                        chunk_size=chunk_size)
+            record['rows'] = len(df)
 
-        if input_args[1] == 'accel':
-            var_name = (input_args[0] + ' acceleration').capitalize()
-        elif input_args[1] == 'disp':
-            var_name = (input_args[0] + ' displacement').capitalize()
-        elif input_args[1] == 'dist':
-            var_name = (input_args[0] + ' distance').capitalize()
-        else:
-            var_name = (input_args[0] + ' ' + input_args[1]).capitalize()
-        
-        df = df[['timeExp', col_name]].copy().dropna().reset_index(drop=True)
-        
-        breakpoint_file_name = os.path.join(repo.working_tree_dir, 'outputs', 'breakpoints')
-        
-        if input_args[0] == 'controller':
-            start = time.time()
-            return_dict = segment_total(time = df['timeExp'], y = df[col_name], sig_level = 10**(-4), 
-                                        return_models=True)
-            print(file_name, 'segmentation done in', time.time()-start, 'seconds.')
-            start = time.time()
-            
-            summarize(df, return_dict['breakpoints'], col_name, model_results=return_dict['model_results'], 
-                      save_name = 'summarize_'+'_'.join([sub, week, session]) + '_c.csv')
-                      
-            print(file_name, 'summarizing done in', time.time()-start, 'seconds.')
-            breakpoint_file_name = os.path.join(breakpoint_file_name, '_'.join([sub, week, session])+'_c.json')
-        
-        else:
-            return_dict = segment_total(time = df['timeExp'], y = df[col_name], window_size = 20, sig_level = 10**(-5),
-                                        return_models=True)
-            summarize(df, return_dict['breakpoints'], col_name, model_results=return_dict['model_results'], 
-                save_name = 'summarize_'+'_'.join([sub, week, session]) + '_h.csv', window_size=20)
-            breakpoint_file_name = os.path.join(breakpoint_file_name, '_'.join([sub, week, session])+'_h.json')
+        _save_segmentation(repo, df, col_name, return_dict, file_name, suffix, window_size, timings)
+    return timings
 
-        with open(breakpoint_file_name, 'w') as breakpoint_file:
-            json.dump(return_dict['breakpoints'], breakpoint_file)
+def segment_file_channels(file_name: str,
+                          channels: list = ['controller/speed', 'head/speed'],
+                          block_jobs: int = 1,
+                          chunk_size: int = None):
+    """Segment several object/variable channels of one session jointly and save the breakpoints and summarization of 
+    each, as segment_file does for each channel separately.
+
+    The channels are joined on timeExp and segmented in a single pass over the shared time axis with 
+    segment_total. Rows missing from any channel are dropped, so the results match separate runs of segment_file 
+    when the channels are missing the same rows.
+
+    Args:
+        file_name (str): Name of the file in input_data/object/variable of every channel, e.g. '1_1_1.csv'.
+        channels (list of str, optional): Channels as 'object/variable'. Defaults to ['controller/speed', 
+        'head/speed'].
+        block_jobs (int, optional): Number of worker processes to segment the sections of the file in. Defaults to 1.
+        chunk_size (int, optional): Segment sections longer than this in overlapping chunks, see segment_total. 
+        Defaults to None.
+    Returns:
+        dict: Seconds spent in each stage.
+    """
+    repo = git.Repo('.', search_parent_directories = True)
+    timings = {}
+
+    with file_span(file_name):
+        with span('load', timings=timings) as record:
+            df = None
+            col_names = []
+            for channel in channels:
+                object_name, variable = channel.split('/')
+                col_name = f'{object_name}_{variable}_clean'
+                channel_df = pd.read_csv(os.path.join(repo.working_tree_dir, 'input_data', object_name, variable, 
+                                                      file_name))
+                channel_df = channel_df[['timeExp', col_name]].dropna()
+                df = channel_df if df is None else df.merge(channel_df, on='timeExp')
+                col_names.append(col_name)
+            df = df.reset_index(drop=True)
+            record['rows'] = len(df)
+
+        parameters = [_parameters(channel.split('/')[0]) for channel in channels]
+
+        with span('segment', timings=timings) as record:
+            return_dicts = segment_total(time = df['timeExp'], y = df[col_names], 
+                                         window_size = [window_size for window_size, _, _ in parameters], 
+                                         sig_level = [sig_level for _, sig_level, _ in parameters], 
+                                         return_models=True, jobs=block_jobs, chunk_size=chunk_size)
+            record['rows'] = len(df)
+
+        for col_name, (window_size, _, suffix) in zip(col_names, parameters):
+            _save_segmentation(repo, df[['timeExp', col_name]], col_name, return_dicts[col_name], file_name, suffix, 
+                               window_size, timings)
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Segment all files of an object/variable type, e.g. head speed.')
+    parser.add_argument('object', nargs='?', default='controller')
+    parser.add_argument('variable', nargs='?', default='speed')
+    parser.add_argument('engine', nargs='?', default='statsmodels')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('--block-jobs', type=int, default=1, 
+                        help='Number of worker processes to segment the sections of each file in.')
+    parser.add_argument('--chunk-size', type=int, default=None, 
+                        help='Segment sections longer than this in overlapping chunks.')
+    parser.add_argument('--channels', nargs='+', default=None, 
+                        help="Segment several channels of each session jointly, given as object/variable, e.g. "
+                             "controller/speed head/speed. Overrides object and variable.")
+    parser.add_argument('--trace', default=None, help='File to append JSON lines timing records of each stage to.')
+    parser.add_argument('--profile', default=None, 
+                        help='Directory to write a cProfile stats file for each file to.')
+    parser.add_argument('--trace-memory', action='store_true', 
+                        help='Also write the largest memory allocation sites of each file to the profile directory.')
+    args = parser.parse_args()
+
+    repo = git.Repo('.', search_parent_directories = True)
+    configure(args.trace, args.profile, args.trace_memory)
+
+    if args.channels is None:
+        files = sorted(os.listdir(os.path.join(repo.working_tree_dir, 'input_data', args.object, args.variable)))
+        tasks = [{'file_name': file_name, 'object_name': args.object, 'variable': args.variable, 
+                  'engine': args.engine, 'block_jobs': args.block_jobs, 'chunk_size': args.chunk_size} 
+                 for file_name in files]
+        function = segment_file
+    else:
+        # Sessions present for every channel
+        files = set.intersection(*[set(os.listdir(os.path.join(repo.working_tree_dir, 'input_data', 
+                                                               *channel.split('/')))) 
+                                   for channel in args.channels])
+        tasks = [{'file_name': file_name, 'channels': args.channels, 'block_jobs': args.block_jobs, 
+                  'chunk_size': args.chunk_size} for file_name in sorted(files)]
+        function = segment_file_channels
 
-        print(file_name, 'done in', time.time()-file_start, 'seconds.')
-        
-    print('Finished in', time.time()-total_start)
+    total_start = time.perf_counter()
+    results = run_batch(function, tasks, jobs=args.jobs)
+    print_timing(results, time.perf_counter() - total_start)
@@ -7,7 +7,7 @@ import os
 def summarize(df:pd.DataFrame,
               breakpoints: list,
               col: str,
-              model_results: list,
+              model_results: np.ndarray,
               save_name: str,
               no_splits: int = 5,
               window_size: int = 10):
@@ -17,39 +17,55 @@ def summarize(df:pd.DataFrame,
         df (pd.DataFrame): dataframe with columns ['timeExp',col].
         breakpoints (list): list of breakpoints indicating sections.
         col (str): name of column (y values).
-        model_results (list of RegressionResults). List of regression results for each segment.
+        model_results (np.array of segment_dtype). Record array of the model for each segment, as returned by 
+        LinearSegmentation.segment.
         min_break_dist (int, optional): minimum number of points for a segment to be considered. Defaults to 10.
         no_splits (int, optional): number of splits for considering data. Defaults to 5.
         window_size (int, optional): _description_. Defaults to 10.
         save_name (str, optional): name to save output file as. Defaults to 'summarize'.
     """    
-    segments = [df.iloc[breakpoints[i-1]:breakpoints[i]] for i in range(1,len(breakpoints)) if breakpoints[i]-breakpoints[i-1] >= window_size-1]
-    
-    mean_segments = list(map(lambda x: np.mean(x[col]),segments))
+    breakpoints = np.asarray(breakpoints, dtype=int)
+    # Segments between consecutive breakpoints that are long enough to be considered
+    keep = np.diff(breakpoints) >= window_size - 1
+    starts = breakpoints[:-1][keep]
+    ends = np.minimum(breakpoints[1:][keep], len(df))
+    lengths = ends - starts
+    # Values of every segment concatenated, with the offset of each segment in them
+    offsets = np.cumsum(lengths) - lengths
+    index = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+    values = df[col].to_numpy(dtype=float)[index]
+    time = df['timeExp'].to_numpy(dtype=float)
+    segment_ids = np.repeat(np.arange(len(lengths)), lengths)
 
-    df_segments = pd.DataFrame({'mean': mean_segments})
-    
-    df_segments['median'] = list(map(lambda x:np.median(x[col]), segments))
+    mean = np.add.reduceat(values, offsets)/lengths
+    centred = values - np.repeat(mean, lengths)
+    # Median from the middle one or two values of each segment once sorted within segments
+    sorted_values = values[np.lexsort((values, segment_ids))]
+    median = (sorted_values[offsets + (lengths - 1)//2] + sorted_values[offsets + lengths//2])/2
 
-    df_segments['start_time'] = list(map(lambda x:x.iloc[0]['timeExp'],segments))
+    df_segments = pd.DataFrame({'mean': mean})
 
-    df_segments['end_time'] = list(map(lambda x:x.iloc[-1]['timeExp'],segments))
+    df_segments['median'] = median
 
-    df_segments['min'] = list(map(lambda x: min(x[col]),segments))
+    df_segments['start_time'] = time[starts]
 
-    df_segments['max'] = list(map(lambda x: max(x[col]),segments))
+    df_segments['end_time'] = time[ends - 1]
 
-    df_segments['std'] = list(map(lambda x: np.std(x[col]),segments))
+    df_segments['min'] = np.minimum.reduceat(values, offsets)
+
+    df_segments['max'] = np.maximum.reduceat(values, offsets)
+
+    df_segments['std'] = np.sqrt(np.add.reduceat(centred*centred, offsets)/lengths)
 
     df_segments['duration'] = df_segments['end_time']-df_segments['start_time']
 
     df_segments['range'] = df_segments['max'] - df_segments['min']
 
-    df_segments['segment_size'] = list(map(lambda x: x.nobs, model_results))
+    df_segments['segment_size'] = model_results['nobs'].astype(float)
 
-    df_segments['beta'] = list(map(lambda x: x.params['timeExp'], model_results))
+    df_segments['beta'] = model_results['slope']
 
-    df_segments['model_std'] = list(map(lambda x: x.scale**.5, model_results))
+    df_segments['model_std'] = np.sqrt(model_results['scale'])
 
     repo = git.Repo('.', search_parent_directories = True)
     save_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_summarize', save_name)
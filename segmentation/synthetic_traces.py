@@ -0,0 +1,173 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+"""
+Generates synthetic controller/head and ADL speed sessions with known breakpoints, in the same layout as input_data,
+for benchmarking and accuracy testing without participant data. Speed is a continuous piecewise linear profile
+alternating between rest and movement, with measurement noise, Hampel-type spikes in the raw speed and, for VR
+sessions, tracking gaps longer than cut_time. The same seed always gives the same session.
+"""
+
+# Default generator parameters for each kind of session
+profiles = {'controller': {'fs': 90, 'segment_seconds': 0.4, 'peak_speed': 0.6, 'noise': 0.01},
+            'head': {'fs': 90, 'segment_seconds': 0.8, 'peak_speed': 0.2, 'noise': 0.005},
+            'adl': {'fs': 120, 'segment_seconds': 0.4, 'peak_speed': 0.4, 'noise': 0.01, 'gaps_per_minute': 0}}
+
+def synthetic_session(minutes: float = 10,
+                      fs: float = 90,
+                      seed: int = 0,
+                      segment_seconds: float = 0.4,
+                      peak_speed: float = 0.6,
+                      rest_probability: float = 0.3,
+                      noise: float = 0.01,
+                      jitter: float = 0.02,
+                      gaps_per_minute: float = 0.2,
+                      gap_seconds: tuple = (1.5, 10),
+                      spikes_per_minute: float = 2,
+                      spike_size: float = 20,
+                      cut_time: float = 1):
+    """Synthetic speed session with ground truth.
+
+    Args:
+        minutes (float, optional): Length of the session, not counting tracking gaps. Defaults to 10.
+        fs (float, optional): Sampling frequency. Defaults to 90.
+        seed (int, optional): Random seed. Defaults to 0.
+        segment_seconds (float, optional): Mean length of a linear segment. Defaults to 0.4.
+        peak_speed (float, optional): Median speed at the knots between segments during movement. Defaults to 0.6.
+        rest_probability (float, optional): Probability that a knot is at rest, with speed below 0.03. Defaults to 0.3.
+        noise (float, optional): Standard deviation of the measurement noise. Defaults to 0.01.
+        jitter (float, optional): Relative standard deviation of the time between frames. Defaults to 0.02.
+        gaps_per_minute (float, optional): Mean number of tracking gaps per minute. Defaults to 0.2.
+        gap_seconds (tuple of float, optional): Range of the length of tracking gaps. Must be above cut_time.
+        Defaults to (1.5, 10).
+        spikes_per_minute (float, optional): Mean number of single sample spikes per minute. Defaults to 2.
+        spike_size (float, optional): Mean height of spikes, in units of noise. Defaults to 20.
+        cut_time (float, optional): Time between samples at which segment_total splits the data. Knots inside a
+        tracking gap are not breakpoints. Defaults to 1.
+    Returns:
+        tuple: (pd.DataFrame with columns ['timeExp', 'speed', 'speed_clean'], dict of ground truth {'breakpoints'
+        (list of int): Index of the last sample before each knot between two linear segments, as returned by
+        LinearSegmentation.segment, 'gaps' (list of int): Index of the first sample after each tracking gap,
+        'spikes' (list of int): Index of each spike in speed}). speed_clean is speed without the spikes.
+    """
+    assert(gap_seconds[0] > cut_time)
+    rng = np.random.default_rng(seed)
+    n = int(round(minutes*60*fs))
+
+    # Time axis with jitter between frames and tracking gaps
+    time = np.cumsum(np.maximum(rng.normal(1, jitter, n), 0.5))/fs
+    gaps = np.sort(rng.choice(np.arange(1, n), size=min(rng.poisson(gaps_per_minute*minutes), n - 1),
+                              replace=False)) if n > 1 else np.zeros(0, dtype=int)
+    gap_lengths = rng.uniform(*gap_seconds, len(gaps))
+    time += np.repeat(np.concatenate([[0], np.cumsum(gap_lengths)]), np.diff(np.concatenate([[0], gaps, [n]])))
+    time -= time[0] if n > 0 else 0
+
+    # Continuous piecewise linear speed profile, with knots a gamma distributed time apart
+    end = time[-1] if n > 0 else 0
+    steps = rng.gamma(2, segment_seconds/2, int(2*end/segment_seconds) + 10)
+    knot_times = np.cumsum(np.maximum(steps, 3/fs))
+    knot_times = np.concatenate([[0], knot_times[knot_times < end]])
+    rest = rng.random(len(knot_times)) < rest_probability
+    knot_values = np.where(rest, rng.uniform(0, 0.03, len(knot_times)),
+                           peak_speed*rng.lognormal(0, 0.5, len(knot_times)))
+    speed_clean = np.abs(np.interp(time, np.append(knot_times, end + 1), np.append(knot_values, knot_values[-1]))
+                         + rng.normal(0, noise, n))
+
+    # Hampel-type spikes: single samples far above their neighbours
+    spikes = np.sort(rng.choice(n, size=min(rng.poisson(spikes_per_minute*minutes), n), replace=False))
+    speed = speed_clean.copy()
+    speed[spikes] += noise*spike_size*(1 + rng.exponential(1, len(spikes)))
+
+    # Breakpoints at the last sample before each knot, unless the knot is inside a tracking gap
+    last = np.searchsorted(time, knot_times[1:], side='right') - 1
+    inside = (last >= 1) & (last < n - 1)
+    last = last[inside]
+    last = last[time[last + 1] - time[last] <= cut_time]
+    breakpoints = np.unique(last)
+
+    df = pd.DataFrame({'timeExp': time, 'speed': speed, 'speed_clean': speed_clean})
+    return df, {'breakpoints': breakpoints.tolist(), 'gaps': gaps.tolist(), 'spikes': spikes.tolist()}
+
+def vr_session(object_name: str = 'controller', minutes: float = 10, seed: int = 0, **kwargs):
+    """Synthetic session with the columns of input_data/<object_name>/speed files.
+
+    Args:
+        object_name (str, optional): 'controller' or 'head'. Defaults to 'controller'.
+        minutes (float, optional): Length of the session. Defaults to 10.
+        seed (int, optional): Random seed. Defaults to 0.
+        kwargs: Passed to synthetic_session, overriding the defaults in profiles[object_name].
+    Returns:
+        tuple: (pd.DataFrame with columns ['timeExp', '<object_name>_speed', '<object_name>_speed_clean'], ground
+        truth as returned by synthetic_session).
+    """
+    df, truth = synthetic_session(minutes=minutes, seed=seed, **{**profiles[object_name], **kwargs})
+    return df.rename(columns={'speed': f'{object_name}_speed', 'speed_clean': f'{object_name}_speed_clean'}), truth
+
+def adl_session(minutes: float = 10, seed: int = 0, **kwargs):
+    """Synthetic session with the columns of input_data/adl files, sampled at 120 Hz without tracking gaps.
+
+    Args:
+        minutes (float, optional): Length of the session. Defaults to 10.
+        seed (int, optional): Random seed. Defaults to 0.
+        kwargs: Passed to synthetic_session, overriding the defaults in profiles['adl'].
+    Returns:
+        tuple: (pd.DataFrame with columns ['speed', 'speed_clean'], ground truth as returned by synthetic_session).
+    """
+    df, truth = synthetic_session(minutes=minutes, seed=seed, **{**profiles['adl'], **kwargs})
+    return df[['speed', 'speed_clean']], truth
+
+def write_sessions(output_dir: str,
+                   sessions: int = 5,
+                   minutes: float = 10,
+                   seed: int = 0):
+    """Write synthetic sessions in the layout of input_data, with their ground truth.
+
+    VR sessions are written to <output_dir>/input_data/<object>/speed/<sub>_1_1.csv for the controller and head, 
+    which share the same time axis and tracking gaps as they are generated from the same seed. ADL
+    sessions are written to <output_dir>/input_data/adl/<young or old>/<sub>.csv and split into halves as
+    preprocess_adl.split_files does. The ground truth of each file is written to the same path under
+    <output_dir>/ground_truth, with a .json extension.
+
+    Args:
+        output_dir (str): Directory to write to.
+        sessions (int, optional): Number of sessions of each kind. Defaults to 5.
+        minutes (float, optional): Length of each session. Defaults to 10.
+        seed (int, optional): Seed of the first session, the others use the following seeds. Defaults to 0.
+    """
+    def write(df, truth, *path, index=False):
+        file_path = os.path.join(output_dir, 'input_data', *path)
+        truth_path = os.path.join(output_dir, 'ground_truth', *path[:-1], os.path.splitext(path[-1])[0] + '.json')
+        for folder in [os.path.dirname(file_path), os.path.dirname(truth_path)]:
+            os.makedirs(folder, exist_ok=True)
+        df.to_csv(file_path, index=index)
+        with open(truth_path, 'w') as truth_file:
+            json.dump(truth, truth_file)
+
+    for sub in range(1, sessions + 1):
+        for object_name in ['controller', 'head']:
+            df, truth = vr_session(object_name, minutes, seed=seed + sub - 1)
+            write(df, truth, object_name, 'speed', f'{sub}_1_1.csv')
+        for offset, group in enumerate(['young', 'old']):
+            df, truth = adl_session(minutes, seed=seed + sessions + 2*(sub - 1) + offset)
+            write(df, truth, 'adl', group, f'{sub}.csv')
+            split = int(len(df)/2)
+            # The last sample of a file is not a breakpoint
+            first = {key: [index for index in values if index < split - (key == 'breakpoints')] 
+                     for key, values in truth.items()}
+            second = {key: [index - split for index in values if index > split - (key != 'breakpoints')] 
+                      for key, values in truth.items()}
+            write(df[:split], first, 'adl', group, 'halves', f'{sub}_1.csv', index=True)
+            write(df[split:].reset_index(drop=True), second, 'adl', group, 'halves', f'{sub}_2.csv', index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write synthetic VR and ADL sessions with known breakpoints.')
+    parser.add_argument('output_dir', help='Directory to write input_data and ground_truth folders to.')
+    parser.add_argument('--sessions', type=int, default=5, help='Number of sessions of each kind.')
+    parser.add_argument('--minutes', type=float, default=10, help='Length of each session in minutes.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_sessions(args.output_dir, args.sessions, args.minutes, args.seed)
@@ -7,72 +7,65 @@ import json
 
 
 
-def metric_ind(kwargs, breakpoint_file_path, file_name, col_name, working_tree_dir, df_path, y_or_o):
-    
-    if 'breakpoints' in kwargs.keys():
+def load_session(metrics, breakpoint_file_path, file_name, working_tree_dir, df_path, y_or_o):
+    """Load a session with the breakpoints and slopes the metrics use.
+
+    Returns:
+        Session: The session, sampled at 120Hz.
+    """
+    breakpoints = None
+    if any('breakpoints' in kwargs for _, kwargs, _, _ in metrics):
         with open(os.path.join(breakpoint_file_path, file_name.strip('.csv')+f'_{y_or_o}.json')) as breakpoint_file:
-            kwargs['breakpoints'] = json.load(breakpoint_file)
+            breakpoints = json.load(breakpoint_file)
 
     df = pd.read_csv(os.path.join(df_path, file_name))
 
-    kwargs['movement'] = df[col_name+'_clean']
     print(file_name)
-    if 'betas' in kwargs.keys():
-        kwargs['betas'] = pd.read_csv(os.path.join(working_tree_dir, 'outputs', 'adl_summarize', 
-                                                    f'summarize_{file_name.strip(".csv")}_{y_or_o}.csv'))['beta']
-    
-    if 'speed' in kwargs.keys():
-        kwargs['speed'] = df['speed_clean']
+    betas = None
+    if any('betas' in kwargs for _, kwargs, _, _ in metrics):
+        betas = pd.read_csv(os.path.join(working_tree_dir, 'outputs', 'adl_summarize', 
+                                         f'summarize_{file_name.strip(".csv")}_{y_or_o}.csv'))['beta']
 
-    return kwargs
+    return Session(df, 120, breakpoints, betas)
 
 
-def metric_values(metrics):
+def group_metric_values(metrics, df_path, breakpoint_file_path, working_tree_dir, y_or_o):
+    """Compute metrics of the '_clean' columns of every session in a folder, file by file, loading each session once.
 
-    metric_df_young = pd.DataFrame(columns = list(map(lambda x: x[2], metrics))+['id'])
-    metric_df_old = metric_df_young.copy()
+    Returns:
+        pd.DataFrame: Value of each metric and id of each session.
+    """
+    metric_val_lists = {metric_name: [] for _, _, metric_name, _ in metrics}
+    id_list = []
+    for file_name in os.listdir(df_path):
+        if file_name == 'halves':
+            continue
+        id_list.append(file_name.strip('.csv'))
 
-    repo = git.Repo('.', search_parent_directories=True)
+        session = load_session(metrics, breakpoint_file_path, file_name, working_tree_dir, df_path, y_or_o)
 
-    input_path = os.path.join(repo.working_tree_dir, 'input_data', 'adl')
+        for metric, kwargs, metric_name, col_name in metrics:
+            metric_val_lists[metric_name].append(session.value(metric, kwargs, col_name+'_clean', 'speed_clean'))
 
-    breakpoint_file_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_breakpoints')
-    
-    for metric, kwargs, metric_name, col_name in metrics:
-        kwargs['fs'] = 120
-        
-        metric_val_list = []
-        id_list = []
-        young_path = os.path.join(input_path, 'young')
-        for file_name in os.listdir(young_path):
-            if file_name == 'halves':
-                continue
-            id_list.append(file_name.strip('.csv'))
-
-            kwargs = metric_ind(kwargs, breakpoint_file_path, file_name, col_name, 
-                                                 repo.working_tree_dir, young_path, 'y')
-
-            metric_val_list.append(metric(**kwargs))
+    metric_df = pd.DataFrame(columns = list(map(lambda x: x[2], metrics))+['id'])
+    metric_df['id'] = id_list
+    for metric_name, metric_val_list in metric_val_lists.items():
+        metric_df[metric_name] = metric_val_list
+    return metric_df
 
-        metric_df_young['id'] = id_list
-        metric_df_young[metric_name] = metric_val_list
 
-        metric_val_list = []
-        id_list = []
-        old_path = os.path.join(input_path, 'old')
-        for file_name in os.listdir(old_path):
-            if file_name == 'halves':
-                continue
-            id_list.append(file_name.strip('.csv'))
+def metric_values(metrics):
 
-            kwargs= metric_ind(kwargs, breakpoint_file_path, file_name, col_name, 
-                                                 repo.working_tree_dir, old_path, 'o')
+    repo = git.Repo('.', search_parent_directories=True)
 
-            metric_val_list.append(metric(**kwargs))
+    input_path = os.path.join(repo.working_tree_dir, 'input_data', 'adl')
 
+    breakpoint_file_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_breakpoints')
 
-        metric_df_old['id'] = id_list
-        metric_df_old[metric_name] = metric_val_list
+    metric_df_young = group_metric_values(metrics, os.path.join(input_path, 'young'), breakpoint_file_path, 
+                                          repo.working_tree_dir, 'y')
+    metric_df_old = group_metric_values(metrics, os.path.join(input_path, 'old'), breakpoint_file_path, 
+                                        repo.working_tree_dir, 'o')
     
     metric_df_young.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'young_metrics.csv'), index=False)
     metric_df_old.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'old_metrics.csv'), index=False)
@@ -80,50 +73,16 @@ def metric_values(metrics):
 
 def metric_values_halves(metrics):
 
-    metric_df_young = pd.DataFrame(columns = list(map(lambda x: x[2], metrics))+['id'])
-    metric_df_old = metric_df_young.copy()
-
     repo = git.Repo('.', search_parent_directories=True)
 
     input_path = os.path.join(repo.working_tree_dir, 'input_data', 'adl')
 
     breakpoint_file_path = os.path.join(repo.working_tree_dir, 'outputs', 'adl_breakpoints')
-    
-    for metric, kwargs, metric_name, col_name in metrics:
-        kwargs['fs'] = 120
-        
-        metric_val_list = []
-        id_list = []
-        young_halves_path = os.path.join(input_path, 'young', 'halves')
-        for file_name in os.listdir(young_halves_path):
-            if file_name == 'halves':
-                continue
-            id_list.append(file_name.strip('.csv'))
-
-            kwargs = metric_ind(kwargs, breakpoint_file_path, file_name, col_name, 
-                                                 repo.working_tree_dir, young_halves_path, 'y')
-
-            metric_val_list.append(metric(**kwargs))
-
-        metric_df_young['id'] = id_list
-        metric_df_young[metric_name] = metric_val_list
-
-        metric_val_list = []
-        id_list = []
-        old_halves_path = os.path.join(input_path, 'old', 'halves')
-        for file_name in os.listdir(old_halves_path):
-            if file_name == 'halves':
-                continue
-            id_list.append(file_name.strip('.csv'))
-
-            kwargs = metric_ind(kwargs, breakpoint_file_path, file_name, col_name, 
-                                                 repo.working_tree_dir, old_halves_path, 'o')
-
-
-            metric_val_list.append(metric(**kwargs))
 
-        metric_df_old['id'] = id_list
-        metric_df_old[metric_name] = metric_val_list
+    metric_df_young = group_metric_values(metrics, os.path.join(input_path, 'young', 'halves'), breakpoint_file_path, 
+                                          repo.working_tree_dir, 'y')
+    metric_df_old = group_metric_values(metrics, os.path.join(input_path, 'old', 'halves'), breakpoint_file_path, 
+                                        repo.working_tree_dir, 'o')
     
     metric_df_young.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'young_metrics_halves.csv'), index=False)
     metric_df_old.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'old_metrics_halves.csv'), index=False)
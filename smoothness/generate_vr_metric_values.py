@@ -6,7 +6,11 @@ from smoothness_metrics import *
 import json
 
 def metric_values(metrics, df_exists = True):
+    """Compute metrics of every VR session, file by file.
 
+    Each session, its breakpoints and its summarize file are loaded once, and all metrics, on the raw and the 
+    '_clean_2' columns, are computed from a Session, which shares the quantities they derive from the data.
+    """
     repo = git.Repo('.', search_parent_directories=True)
 
     input_path = os.path.join(repo.working_tree_dir, 'input_data', 'controller', 'speed')
@@ -19,44 +23,37 @@ def metric_values(metrics, df_exists = True):
         metric_df = pd.DataFrame(columns = list(map(lambda x: x[2], metrics))+
                                              list(map(lambda x: x[2]+'_clean', metrics))+['id'])
 
-    for metric, kwargs, metric_name, col_name in metrics:
-        kwargs['fs'] = 90
-        
-        metric_val_list = []
-        metric_val_list_clean = []
-        id_list = []
-        for file_name in os.listdir(os.path.join(input_path)):
-            print(file_name)
-            id_list.append(file_name.strip('.csv'))
-            if 'breakpoints' in kwargs.keys():
-                with open(os.path.join(breakpoint_file_path, file_name.strip('.csv')+'_c.json')) as breakpoint_file:
-                    kwargs['breakpoints'] = json.load(breakpoint_file)
-            
-            
-            df = pd.read_csv(os.path.join(input_path, file_name))
+    # Only load what some metric uses
+    load_breakpoints = any('breakpoints' in kwargs for _, kwargs, _, _ in metrics)
+    load_betas = any('betas' in kwargs for _, kwargs, _, _ in metrics)
+
+    metric_val_lists = {name: [] for _, _, metric_name, _ in metrics for name in [metric_name, metric_name+'_clean']}
+    id_list = []
+    for file_name in os.listdir(os.path.join(input_path)):
+        print(file_name)
+        id_list.append(file_name.strip('.csv'))
+        breakpoints = None
+        if load_breakpoints:
+            with open(os.path.join(breakpoint_file_path, file_name.strip('.csv')+'_c.json')) as breakpoint_file:
+                breakpoints = json.load(breakpoint_file)
+        betas = None
+        if load_betas:
+            betas = pd.read_csv(os.path.join(repo.working_tree_dir, 'outputs', 'summarize', 
+                                             'summarize_'+file_name.strip('.csv')+'_c.csv'))['beta']
 
-            kwargs['movement'] = df[col_name]
-            if 'betas' in kwargs.keys():
-                kwargs['betas'] = pd.read_csv(os.path.join(repo.working_tree_dir, 'outputs', 'summarize', 
-                                                           'summarize_'+file_name.strip('.csv')+'_c.csv'))['beta']
-            kwargs_clean = kwargs.copy()
-            kwargs_clean['movement'] = df[col_name+'_clean_2']
-            
-            if 'speed' in kwargs.keys():
-                kwargs['speed'] = df['controller_speed']
-                kwargs_clean['speed'] = df['controller_speed_clean_2']
+        session = Session(pd.read_csv(os.path.join(input_path, file_name)), 90, breakpoints, betas)
 
-            metric_val_list.append(metric(**kwargs))
-            metric_val_list_clean.append(metric(**kwargs_clean))
+        for metric, kwargs, metric_name, col_name in metrics:
+            metric_val_lists[metric_name].append(session.value(metric, kwargs, col_name, 'controller_speed'))
+            metric_val_lists[metric_name+'_clean'].append(session.value(metric, kwargs, col_name+'_clean_2', 
+                                                                        'controller_speed_clean_2'))
 
-        if not df_exists:
-            metric_df['id'] = id_list
+    if not df_exists:
+        metric_df['id'] = id_list
+    for metric_name, metric_val_list in metric_val_lists.items():
         metric_df[metric_name] = metric_val_list
-        metric_df[metric_name+'_clean'] = metric_val_list_clean
 
-        print(metric_name, 'done')
-    
-        metric_df.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'vr_metrics.csv'), index=False)
+    metric_df.to_csv(os.path.join(repo.working_tree_dir, 'outputs', 'vr_metrics.csv'), index=False)
 
 if __name__ == "__main__":
     
@@ -0,0 +1,211 @@
+import numpy as np
+from collections import deque
+
+class OnlinePathLength:
+    """
+    Streaming path length of a speed profile, the distance used by nop and nos, for live data.
+
+    Samples are added one at a time (or in batches) and the value is available at any moment. Only a running sum is
+    kept, so memory use does not grow with session length.
+    """
+    def __init__(self, fs: float):
+        """Initialiser function for class.
+
+        Args:
+            fs (float): Sampling frequency.
+        """
+        self.fs = fs
+        # Number of samples seen and their sum, added in order as sum(movement) does
+        self.n = 0
+        self.total = 0
+
+    def update(self, x: float):
+        """Add a speed sample.
+        """
+        self.n += 1
+        self.total += x
+
+    def update_batch(self, xs):
+        """Add several speed samples.
+
+        Args:
+            xs (iterable of float): Speed samples.
+        """
+        for x in xs:
+            self.update(x)
+
+    def value(self):
+        """Path length of the samples seen so far.
+        """
+        return self.total/self.fs
+
+class OnlineLDJ:
+    """
+    Streaming version of ldj with data_type 'speed', for live data.
+
+    The jerk of each new sample is computed from the last three samples, and the sum of squared jerk and the peak
+    speed are kept as running values, so each update takes O(1) time and memory use does not grow with session length.
+    The value is that of ldj on all the samples seen so far.
+    """
+    def __init__(self, fs: float):
+        """Initialiser function for class.
+
+        Args:
+            fs (float): Sampling frequency.
+        """
+        self.fs = fs
+        self.n = 0
+        self.peak = 0.0
+        self.sum_squares = 0
+        # Last two samples, oldest first
+        self.last = deque(maxlen=2)
+
+    def update(self, x: float):
+        """Add a speed sample.
+        """
+        self.n += 1
+        self.peak = max(self.peak, abs(x))
+        if len(self.last) == 2:
+            dt = 1. / self.fs
+            # Differences in the order of np.diff(movement, 2)
+            jerk = ((x - self.last[1]) - (self.last[1] - self.last[0])) / pow(dt, 2)
+            self.sum_squares += jerk*jerk
+        self.last.append(x)
+
+    def update_batch(self, xs):
+        """Add several speed samples.
+
+        Args:
+            xs (iterable of float): Speed samples.
+        """
+        for x in xs:
+            self.update(x)
+
+    def value(self):
+        """LDJ of the samples seen so far.
+        """
+        dt = 1. / self.fs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = pow(np.float64(self.n * dt), 3) / pow(np.float64(self.peak), 2)
+            return -np.log(abs(- scale * self.sum_squares * dt))
+
+class OnlineNoP(OnlinePathLength):
+    """
+    Streaming version of nop, for live data.
+
+    A peak is found once a lower sample follows it, as in find_peaks, with the lowest sample back to the nearest
+    higher sample on its left as its left base. Its prominence only grows as samples arrive on its right, until a
+    higher sample arrives, so it is counted as soon as a sample is low enough and dropped once a higher sample arrives.
+    The peaks not yet counted or dropped are kept by height, highest first: low samples count them from the front and
+    high samples drop them from the back, so each update takes O(1) amortized time. The value is that of nop on all the
+    samples seen so far.
+
+    Memory use does not grow with session length, but with the number of samples, or peaks, lower than every sample
+    before them since the last higher one, which only grows over a long steady fall in speed.
+    """
+    def __init__(self, fs: float, prominence: float = 0.05):
+        """Initialiser function for class.
+
+        Args:
+            fs (float): Sampling frequency.
+            prominence (float, optional): Smallest prominence of a counted peak. Defaults to 0.05.
+        """
+        super().__init__(fs)
+        self.prominence = prominence
+        self.count = 0
+        # Samples with no higher sample after them as (height, lowest sample since the previous such sample)
+        self.greater = []
+        # Peaks neither counted nor dropped as (height, left base), heights decreasing
+        self.pending = deque()
+        self.prev = None
+        self.prev_left_min = None
+        # Whether the last sample is on a plateau, or rise, that started above the sample before it
+        self.rising = False
+
+    def update(self, x: float):
+        """Add a speed sample.
+        """
+        super().update(x)
+        # Lowest sample since the nearest higher sample on the left
+        left_min = x
+        while self.greater and self.greater[-1][0] <= x:
+            left_min = min(left_min, self.greater.pop()[1])
+        self.greater.append((x, left_min))
+
+        if self.prev is not None:
+            if x < self.prev and self.rising:
+                # The plateau ending at prev is a peak, the lowest sample back to a higher one is its left base
+                if self.prev - self.prev_left_min >= self.prominence:
+                    self.pending.append((self.prev, self.prev_left_min))
+            if x > self.prev:
+                self.rising = True
+            elif x < self.prev:
+                self.rising = False
+        # Peaks lower than x can have no more samples on their right
+        while self.pending and self.pending[-1][0] < x:
+            self.pending.pop()
+        # Peaks with x on their right, highest first, are counted while x makes them prominent enough
+        while self.pending and self.pending[0][0] - max(self.pending[0][1], x) >= self.prominence:
+            self.pending.popleft()
+            self.count += 1
+        self.prev = x
+        self.prev_left_min = left_min
+
+    def value(self):
+        """NoP of the samples seen so far.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return -self.count/np.float64(self.total/self.fs)
+
+class OnlineNoS(OnlinePathLength):
+    """
+    Streaming version of nos, for live data.
+
+    Breakpoints are added with the samples that confirm them, e.g. as returned by OnlineLinearSegmenter.update, and
+    only the last breakpoint is kept. The value is that of nos on all the samples and breakpoints seen so far.
+    """
+    def __init__(self, fs: float):
+        """Initialiser function for class.
+
+        Args:
+            fs (float): Sampling frequency.
+        """
+        super().__init__(fs)
+        self.count = 0
+        self.prev_break = 0
+
+    def update(self, x: float, breakpoints: list = None):
+        """Add a speed sample.
+
+        Args:
+            x (float): Speed sample.
+            breakpoints (list of int, optional): Breakpoints confirmed by this sample, increasing. Defaults to None, 
+            for none.
+        """
+        super().update(x)
+        self.update_breakpoints(breakpoints or ())
+
+    def update_batch(self, xs, breakpoints: list = None):
+        """Add several speed samples.
+
+        Args:
+            xs (iterable of float): Speed samples.
+            breakpoints (list of int, optional): Breakpoints confirmed by these samples, increasing. Defaults to None, 
+            for none.
+        """
+        super().update_batch(xs)
+        self.update_breakpoints(breakpoints or ())
+
+    def update_breakpoints(self, breakpoints: list):
+        """Add breakpoints without samples.
+        """
+        for _break in breakpoints:
+            if _break - self.prev_break >= 2:
+                self.count += 1
+            self.prev_break = _break
+
+    def value(self):
+        """NoS of the samples and breakpoints seen so far.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return -self.count/np.float64(self.total/self.fs)
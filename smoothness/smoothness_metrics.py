@@ -4,6 +4,7 @@ smoothness.py contains a list of functions for estimating movement smoothness.
 """
 import numpy as np
 import pandas as pd
+from functools import lru_cache
 from scipy.signal import find_peaks
 
 
@@ -91,6 +92,128 @@ def sparc(movement, fs, padlevel=4, fc=10.0, amp_th=0.05, return_spectrum: bool
     else:
         return new_sal
 
+@lru_cache(maxsize=16)
+def frequency_grid(nfft: int, fs: float, fc: float):
+    """Frequencies of the nfft point spectrum used by sparc, np.arange(0, fs, fs / nfft), up to the cut off frequency 
+    fc. Only these are built, as np.arange(k) * (fs / nfft), which gives the same values. Cached by (nfft, fs, fc), so 
+    the array returned is read only.
+    """
+    step = fs / nfft
+    # Length of np.arange(0, fs, step), and one more than the frequencies within fc before rounding
+    count = min(int(np.ceil(fs / step)), int(fc / step) + 2)
+    f = np.arange(count) * step
+    f = f[f <= fc]
+    f.flags.writeable = False
+    return f
+
+def _arc_lengths(f_sel, Mf_sel, amp_th):
+    """Spectral arc lengths of several normalized magnitude spectra, as computed by sparc.
+
+    Args:
+        f_sel (np.array of float): Frequencies up to the cut off frequency.
+        Mf_sel (np.array of float): Normalized magnitude spectra at f_sel, one per row.
+        amp_th (float or np.array of float): Amplitude threshold, or one per row as a column.
+    Returns:
+        tuple of np.array: (arc lengths, whether any point of each spectrum is greater than or equal to the 
+        threshold). The arc length is 0 where no point is.
+    """
+    # First and last points of each spectrum greater than or equal to the amplitude threshold
+    above = Mf_sel >= amp_th
+    found = above.any(axis=1)
+    first = above.argmax(axis=1)
+    last = len(f_sel) - 1 - above[:, ::-1].argmax(axis=1)
+
+    # Calculate arc lengths between the first and last points
+    columns = np.arange(len(f_sel) - 1)
+    inside = (columns >= first[:, None]) & (columns < last[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        arcs = np.sqrt(pow(np.diff(f_sel) / (f_sel[last] - f_sel[first])[:, None], 2) + 
+                       pow(np.diff(Mf_sel, axis=1), 2))
+    return -np.where(inside, arcs, 0).sum(axis=1), found
+
+def sparc_batch(movements: list, fs, padlevel=4, fc=10.0, amp_th=0.05):
+    """SPARC of several movements, equal to calling sparc on each.
+
+    Movements are grouped by nfft and each group is zero padded into a 2-D array, so that one real FFT gives the half 
+    spectrum of every movement in the group. The amplitude threshold cut off and the arc length are then computed for 
+    all rows at once. Movements sparc cannot handle, e.g. with no spectrum above amp_th below fc, are passed to sparc, 
+    which raises the same error as it would have.
+
+    Args:
+        movements (list of np.array of float): Speed profiles.
+        fs (float): Sampling frequency.
+        padlevel (int, optional): See sparc. Defaults to 4.
+        fc (float, optional): See sparc. Defaults to 10.0.
+        amp_th (float, optional): See sparc. Defaults to 0.05.
+    Returns:
+        np.array of float: SPARC of each movement.
+    """
+    values = np.zeros(len(movements))
+    lengths = np.array([len(movement) for movement in movements], dtype=int)
+    with np.errstate(divide='ignore'):
+        nffts = np.where(lengths > 0, pow(2, np.ceil(np.log2(lengths)) + padlevel), 0).astype(int)
+    for nfft in np.unique(nffts):
+        rows = np.flatnonzero(nffts == nfft)
+        # The half spectrum only holds the frequencies within fc if fc is below the Nyquist frequency
+        if nfft < 2 or fc >= fs / 2:
+            values[rows] = [sparc(movements[row], fs, padlevel, fc, amp_th) for row in rows]
+            continue
+        # fc is below the Nyquist frequency, so these are all in the half spectrum
+        f_sel = frequency_grid(int(nfft), fs, fc)
+        # Rows per FFT, limiting the size of the padded array
+        chunk_size = max(1, 2**22 // nfft)
+        for chunk in range(0, len(rows), chunk_size):
+            chunk_rows = rows[chunk:chunk + chunk_size]
+            # Zero padded movements, one per row
+            chunk_lengths = lengths[chunk_rows]
+            offsets = np.cumsum(chunk_lengths) - chunk_lengths
+            padded = np.zeros((len(chunk_rows), nfft))
+            padded[np.repeat(np.arange(len(chunk_rows)), chunk_lengths), 
+                   np.arange(chunk_lengths.sum()) - np.repeat(offsets, chunk_lengths)] = np.concatenate(
+                       [movements[row] for row in chunk_rows])
+            # Normalized magnitude spectrum, whose maximum is in the first half for real data
+            Mf = abs(np.fft.rfft(padded, axis=1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Mf = Mf / Mf.max(axis=1, keepdims=True)
+            values[chunk_rows], found = _arc_lengths(f_sel, Mf[:, :len(f_sel)], amp_th)
+            for row in chunk_rows[~found]:
+                values[row] = sparc(movements[row], fs, padlevel, fc, amp_th)
+    return values
+
+def sparc_grid(movement, fs, padlevels=[4], fcs=[10.0], amp_ths=[0.05]):
+    """SPARC of a movement for every combination of padlevel, fc and amp_th, equal to calling sparc with each.
+
+    The magnitude spectrum only depends on padlevel, so it is computed once per padlevel, and the arc lengths for all 
+    amplitude thresholds are computed at once for each cut off frequency.
+
+    Args:
+        movement (np.array of float): Speed profile.
+        fs (float): Sampling frequency.
+        padlevels (list of int, optional): Values of padlevel, see sparc. Defaults to [4].
+        fcs (list of float, optional): Values of fc, see sparc. Defaults to [10.0].
+        amp_ths (list of float, optional): Values of amp_th, see sparc. Defaults to [0.05].
+    Returns:
+        pd.DataFrame: Columns ['padlevel', 'fc', 'amp_th', 'sparc'], one row per combination. sparc is NaN where no 
+        point of the spectrum within fc reaches amp_th, for which sparc raises an IndexError.
+    """
+    movement = np.asarray(movement, dtype=float)
+    amp_ths = np.asarray(amp_ths, dtype=float)
+    rows = []
+    for padlevel in padlevels:
+        nfft = int(pow(2, np.ceil(np.log2(len(movement))) + padlevel))
+        f = frequency_grid(nfft, fs, max(fcs))
+        # Normalized magnitude spectrum
+        Mf = abs(np.fft.fft(movement, nfft))
+        Mf = Mf / max(Mf)
+        for fc in fcs:
+            # f is increasing, so the frequencies within fc come first
+            n_sel = np.count_nonzero(f <= fc)
+            values, found = _arc_lengths(f[:n_sel], np.broadcast_to(Mf[:n_sel], (len(amp_ths), n_sel)), 
+                                         amp_ths[:, None])
+            values[~found] = np.nan
+            rows += [(padlevel, fc, amp_th, value) for amp_th, value in zip(amp_ths, values)]
+    return pd.DataFrame(rows, columns=['padlevel', 'fc', 'amp_th', 'sparc'])
+
 def ldj_adl(movement, fs, movement_peak = 0, data_type='speed'):
     
     # first enforce data into an numpy array.
@@ -210,18 +333,19 @@ def nop(movement, fs):
 
     return -no_peaks/distance
 
-def nos(movement, fs, breakpoints):
+def nos(movement, fs, breakpoints, distance=None):
     prev_break=0
     count=0
     for _break in breakpoints:
         if _break - prev_break >=2:
             count+=1
         prev_break = _break
-    distance = sum(movement)/fs
+    if distance is None:
+        distance = sum(movement)/fs
 
     return -count/distance
 
-def nosp(movement, fs, breakpoints, betas):
+def nosp(movement, fs, breakpoints, betas, distance=None):
     prev_break=breakpoints[0]
     count=0
     index=1
@@ -234,39 +358,365 @@ def nosp(movement, fs, breakpoints, betas):
             index+=1
             
         prev_break = _break
-    distance = sum(movement)/fs
+    if distance is None:
+        distance = sum(movement)/fs
 
     return -count/distance
 
+class _SparseTable:
+    """
+    Sparse table of an idempotent function, np.fmax or np.fmin, over all power of two ranges of an array, so that the 
+    function over any range takes O(1) time.
+    """
+    def __init__(self, values, function):
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        levels = max(int(n).bit_length(), 1)
+        self.function = function
+        # Row k holds the function over [i, i + 2**k), rows are padded with NaN at the end
+        self.table = np.full((levels, n), np.nan)
+        self.table[0] = values
+        for k in range(1, levels):
+            half = 2**(k - 1)
+            self.table[k, :n - 2*half + 1] = function(self.table[k-1, :n - 2*half + 1], 
+                                                      self.table[k-1, half:n - half + 1])
+
+    def query(self, starts: np.ndarray, stops: np.ndarray):
+        """Function over the ranges [starts, stops), which must not be empty.
+        """
+        # Two overlapping power of two ranges cover each range
+        k = np.floor(np.log2(stops - starts)).astype(int)
+        return self.function(self.table[k, starts], self.table[k, stops - 2**k])
+
+class SegmentIndex:
+    """
+    Prefix sums of the squared movement and a sparse table of speed maxima over a whole recording, so that the sum of 
+    squares and the peak speed of any segment, and so its LDJ, take O(1) time. One index can be used for any number of 
+    sets of breakpoints, e.g. from a parameter sweep.
+    """
+    def __init__(self, movement, speed):
+        """Initialiser function for class.
+
+        Args:
+            movement (pd.Series or np.array of float): Jerk profile. Segments containing NaN have a NaN sum of squares.
+            speed (pd.Series or np.array of float): Speed profile, usually the same length as movement. NaN values are 
+            ignored by peak.
+        """
+        movement = np.asarray(movement, dtype=float)
+        missing = np.isnan(movement)
+        self.square_sums = np.concatenate([[0], np.cumsum(np.where(missing, 0, movement*movement))])
+        self.missing_counts = np.concatenate([[0], np.cumsum(missing)])
+        self.speed_max = _SparseTable(speed, np.fmax)
+
+    def sum_squares(self, starts: np.ndarray, stops: np.ndarray):
+        """Sum of the squared movement over the segments [starts, stops).
+        """
+        sums = self.square_sums[stops] - self.square_sums[starts]
+        return np.where(self.missing_counts[stops] > self.missing_counts[starts], np.nan, sums)
+
+    def peak(self, starts: np.ndarray, stops: np.ndarray):
+        """Maximum speed over the segments [starts, stops), which must not be empty.
+        """
+        return self.speed_max.query(starts, stops)
+
+    def ldj(self, starts: np.ndarray, stops: np.ndarray, fs: float):
+        """LDJ of the segments [starts, stops) of a jerk profile, as ldj with data_type 'jerk' and the peak speed of 
+        each segment as movement_peak.
+        """
+        dt = 1. / fs
+        scale = pow((stops - starts) * dt, 3) / pow(self.peak(starts, stops), 2)
+        with np.errstate(divide='ignore'):
+            return -np.log(abs(- scale * self.sum_squares(starts, stops) * dt))
+
 class SegmentMetric:
     def __init__(self, metric):
         self.metric = metric
 
-    def value(self, movement, fs: float, breakpoints: list, data_type: str = None, speed = []):
-        assert(breakpoints[-1] <= len(movement))
-
-        prev_break = 0
-
-        metric_list = []
+    def segments(self, length: int, breakpoints: list):
+        """Segments the metric is averaged over: the points from the previous breakpoint up to the point before each 
+        breakpoint, skipping segments of fewer than 10 points, whose points are added to the next segment.
+
+        Args:
+            length (int): Length of the movement.
+            breakpoints (list of int): Breakpoints.
+        Returns:
+            tuple of np.array of int: (starts, stops, weights) of each segment, where the segment is [start, stop) and 
+            its weight in the average is the distance between its breakpoints.
+        """
+        starts = []
+        stops = []
         weights = []
-
+        prev_break = 0
         for _break in breakpoints:
-
-            cur_movement = movement[prev_break:_break - 1].reset_index(drop=True)
-            if len(cur_movement)<10:
+            # Same bounds as slicing movement[prev_break:_break - 1]
+            start, stop, _ = slice(prev_break, _break - 1).indices(length)
+            if stop - start < 10:
                 continue
-            if data_type is None:
-                metric_list.append(self.metric(cur_movement, fs))
-                
-            else:
-                cur_speed = speed[prev_break:_break - 1].reset_index(drop=True)
-                metric_list.append(self.metric(cur_movement, fs, data_type=data_type, movement_peak = max(cur_speed)))
+            starts.append(start)
+            stops.append(stop)
             weights.append(_break - prev_break)
             prev_break = _break
+        return np.array(starts, dtype=int), np.array(stops, dtype=int), np.array(weights)
+
+    def value(self, movement, fs: float, breakpoints: list, data_type: str = None, speed = [], 
+              index: SegmentIndex = None):
+        """Weighted average of the metric over the segments of a movement.
+
+        LDJ of jerk is computed from a SegmentIndex of the movement and speed, in O(1) per segment, and SPARC for all 
+        segments at once with sparc_batch.
+
+        Args:
+            movement (pd.Series of float): Movement profile, e.g. speed or jerk.
+            fs (float): Sampling frequency.
+            breakpoints (list of int): Breakpoints.
+            data_type (str, optional): Passed to the metric with the peak speed of each segment if not None. Defaults 
+            to None.
+            speed (pd.Series of float, optional): Speed profile, used if data_type is not None. Defaults to [].
+            index (SegmentIndex, optional): Index of movement and speed, to reuse over several sets of breakpoints 
+            when the metric is ldj and data_type is 'jerk'. Built if None. Defaults to None.
+        Returns:
+            float: Average of the metric over segments, weighted by segment length, ignoring NaN values.
+        """
+        assert(breakpoints[-1] <= len(movement))
+
+        starts, stops, weights = self.segments(len(movement), breakpoints)
+
+        if self.metric is ldj and data_type == 'jerk':
+            if index is None:
+                index = SegmentIndex(movement, speed)
+            metric_list = index.ldj(starts, stops, fs)
+        elif self.metric is sparc and data_type is None:
+            values = np.asarray(movement, dtype=float)
+            # SPARC is always finite, so segments of zero weight, such as the whole movement when the first 
+            # breakpoint is 0, do not change the average and are not computed
+            metric_list = np.zeros(len(starts))
+            weighted = np.flatnonzero(weights > 0)
+            metric_list[weighted] = sparc_batch([values[starts[k]:stops[k]] for k in weighted], fs)
+        else:
+            metric_list = []
+            for start, stop in zip(starts, stops):
+                cur_movement = movement[start:stop].reset_index(drop=True)
+                if data_type is None:
+                    metric_list.append(self.metric(cur_movement, fs))
+                else:
+                    cur_speed = speed[start:stop].reset_index(drop=True)
+                    metric_list.append(self.metric(cur_movement, fs, data_type=data_type, 
+                                                   movement_peak = max(cur_speed)))
+            metric_list = np.array(metric_list)
 
-        metric_list = np.array(metric_list)
-        weights = np.array(weights)
         weights = weights[~np.isnan(metric_list)]
         metric_list = metric_list[~np.isnan(metric_list)]
 
-        return np.average(metric_list, weights=weights)
\ No newline at end of file
+        return np.average(metric_list, weights=weights)
+
+class Session:
+    """
+    Columns of one session, loaded once, and the quantities metrics derive from them: distance, differences, jerk, 
+    peak speed and SegmentIndex. These are computed on first use and shared by all the metrics of the session, so each 
+    metric only does its own work. Metrics without a fast path are called as before on the columns.
+    """
+    def __init__(self, df: pd.DataFrame, fs: float, breakpoints: list = None, betas: pd.Series = None):
+        """Initialiser function for class.
+
+        Args:
+            df (pd.DataFrame): Columns of the session.
+            fs (float): Sampling frequency.
+            breakpoints (list of int, optional): Breakpoints of the session, for metrics taking breakpoints. Defaults 
+            to None.
+            betas (pd.Series of float, optional): Slopes of the segments of the session, for metrics taking betas. 
+            Defaults to None.
+        """
+        self.df = df
+        self.fs = fs
+        self.breakpoints = breakpoints
+        self.betas = betas
+        self._cache = {}
+
+    def _cached(self, key: tuple, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def array(self, col_name: str):
+        """Column as an array of float."""
+        return self._cached(('array', col_name), lambda: self.df[col_name].to_numpy(dtype=float))
+
+    def distance(self, col_name: str):
+        """Path length of a speed column, as used by nop, nos and nosp."""
+        return self._cached(('distance', col_name), lambda: np.sum(self.array(col_name))/self.fs)
+
+    def peak(self, col_name: str):
+        """Largest absolute value of a column."""
+        return self._cached(('peak', col_name), lambda: np.max(np.abs(self.array(col_name))))
+
+    def diff(self, col_name: str, order: int = 1):
+        """Differences of a column, not divided by the sampling interval."""
+        return self._cached(('diff', col_name, order), lambda: np.diff(self.array(col_name), order))
+
+    def jerk(self, col_name: str):
+        """Jerk of a speed column."""
+        return self._cached(('jerk', col_name), lambda: self.diff(col_name, 2) * pow(self.fs, 2))
+
+    def index(self, col_name: str, speed_name: str):
+        """SegmentIndex of a jerk column and a speed column."""
+        return self._cached(('index', col_name, speed_name), 
+                            lambda: SegmentIndex(self.array(col_name), self.array(speed_name)))
+
+    def value(self, metric, kwargs: dict, col_name: str, speed_name: str = None):
+        """Value of a metric on a column of the session.
+
+        Args:
+            metric (function): Metric, e.g. ldj or SegmentMetric(sparc).value.
+            kwargs (dict): Keyword arguments of the metric. Values of 'breakpoints', 'betas' and 'speed' are replaced 
+            by those of the session, and 'fs' and 'movement' are set.
+            col_name (str): Column of the movement.
+            speed_name (str, optional): Column of the speed, for metrics taking speed. Defaults to None.
+        Returns:
+            float: Value of the metric.
+        """
+        kwargs = dict(kwargs, fs=self.fs)
+        if 'breakpoints' in kwargs:
+            kwargs['breakpoints'] = self.breakpoints
+        if 'betas' in kwargs:
+            kwargs['betas'] = self.betas
+        data_type = kwargs.get('data_type', 'speed')
+        dt = 1. / self.fs
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if metric is ldj and data_type == 'speed':
+                jerk = self.jerk(col_name)
+                scale = pow(len(self.array(col_name)) * dt, 3) / pow(self.peak(col_name), 2)
+                return -np.log(abs(- scale * np.dot(jerk, jerk) * dt))
+            if metric is ldj_adl and data_type == 'speed':
+                diff = self.diff(col_name)
+                scale = pow(len(self.array(col_name)) * dt, 3) / pow(self.peak(col_name), 2)
+                return - np.log(scale * np.dot(diff, diff))
+            if metric is nop:
+                return -len(find_peaks(self.array(col_name), prominence=0.05)[0])/self.distance(col_name)
+            if metric in (nos, nosp):
+                kwargs['distance'] = self.distance(col_name)
+        if 'speed' in kwargs:
+            kwargs['speed'] = self.df[speed_name]
+        if getattr(metric, '__func__', None) is SegmentMetric.value and metric.__self__.metric is ldj \
+                and data_type == 'jerk':
+            kwargs['index'] = self.index(col_name, speed_name)
+        return metric(movement=self.df[col_name], **kwargs)
+
+def _window_starts(length: int, window: int, hop: int):
+    """Start of each full window of a rolling metric."""
+    if window < 1 or hop < 1:
+        raise ValueError('window and hop must be at least 1')
+    return np.arange(0, length - window + 1, hop)
+
+def _rolling_series(values, starts, window, fs, name):
+    """Rolling metric values indexed by the time in seconds of the centre of their window."""
+    return pd.Series(values, index=pd.Index((starts + window / 2) / fs, name='time'), name=name)
+
+def rolling_sparc(movement, fs, window: int, hop: int, padlevel=4, fc=10.0, amp_th=0.05):
+    """SPARC over a sliding window of a whole session, equal to calling sparc on each window.
+
+    All windows have the same nfft, so the spectra are computed STFT style by sparc_batch, with one real FFT per chunk 
+    of windows. Windows are views of the movement and are not copied.
+
+    Args:
+        movement (pd.Series or np.array of float): Speed profile of the session.
+        fs (float): Sampling frequency.
+        window (int): Window length in samples.
+        hop (int): Samples between the starts of consecutive windows.
+        padlevel (int, optional): See sparc. Defaults to 4.
+        fc (float, optional): See sparc. Defaults to 10.0.
+        amp_th (float, optional): See sparc. Defaults to 0.05.
+    Returns:
+        pd.Series of float: SPARC of each full window, indexed by the time in seconds of the window centre.
+    """
+    movement = np.asarray(movement, dtype=float)
+    starts = _window_starts(len(movement), window, hop)
+    if len(starts) == 0:
+        return _rolling_series([], starts, window, fs, 'sparc')
+    windows = np.lib.stride_tricks.sliding_window_view(movement, window)
+    return _rolling_series(sparc_batch([windows[start] for start in starts], fs, padlevel, fc, amp_th), starts, 
+                           window, fs, 'sparc')
+
+def rolling_ldj(movement, fs, window: int, hop: int):
+    """LDJ over a sliding window of a whole session, equal to calling ldj with data_type 'speed' on each window.
+
+    The jerk of the session is computed once and the sum of squared jerk and the peak speed of each window are read 
+    from a SegmentIndex, so each window takes O(1) time whatever its length.
+
+    Args:
+        movement (pd.Series or np.array of float): Speed profile of the session.
+        fs (float): Sampling frequency.
+        window (int): Window length in samples, at least 3.
+        hop (int): Samples between the starts of consecutive windows.
+    Returns:
+        pd.Series of float: LDJ of each full window, indexed by the time in seconds of the window centre.
+    """
+    if window < 3:
+        raise ValueError('window must be at least 3 samples to have a jerk')
+    movement = np.asarray(movement, dtype=float)
+    starts = _window_starts(len(movement), window, hop)
+    if len(starts) == 0:
+        return _rolling_series([], starts, window, fs, 'ldj')
+    dt = 1. / fs
+    # The jerk of a window is the slice of the jerk of the session starting at the same sample
+    index = SegmentIndex(np.diff(movement, 2) / pow(dt, 2), np.abs(movement))
+    scale = pow(window * dt, 3) / pow(index.peak(starts, starts + window), 2)
+    with np.errstate(divide='ignore'):
+        values = -np.log(abs(- scale * index.sum_squares(starts, starts + window - 2) * dt))
+    return _rolling_series(values, starts, window, fs, 'ldj')
+
+def rolling_nop(movement, fs, window: int, hop: int):
+    """NoP over a sliding window of a whole session, equal to calling nop on each window.
+
+    Peaks of the session are found once. A peak is a peak of a window when both neighbours of its plateau are in the 
+    window, so the peaks of each window are a contiguous run of them, tracked by moving its ends along the session. 
+    Prominence is measured within the window, as find_peaks does, from the nearest higher sample on each side of the 
+    peak, found once per peak, and range minima of the movement clipped to the window.
+
+    Args:
+        movement (pd.Series or np.array of float): Speed profile of the session.
+        fs (float): Sampling frequency.
+        window (int): Window length in samples.
+        hop (int): Samples between the starts of consecutive windows.
+    Returns:
+        pd.Series of float: NoP of each full window, indexed by the time in seconds of the window centre.
+    """
+    movement = np.asarray(movement, dtype=float)
+    n = len(movement)
+    starts = _window_starts(n, window, hop)
+    if len(starts) == 0:
+        return _rolling_series([], starts, window, fs, 'nop')
+    stops = starts + window
+    sums = np.concatenate([[0], np.cumsum(movement)])
+    distances = (sums[stops] - sums[starts]) / fs
+
+    peaks, properties = find_peaks(movement, plateau_size=1)
+    maxima = _SparseTable(movement, np.fmax)
+    minima = _SparseTable(movement, np.fmin)
+    heights = movement[peaks]
+    # Extend [left, right) from each peak while the movement is not above the peak, doubling then halving the step
+    left = peaks.copy()
+    right = peaks + 1
+    for k in reversed(range(maxima.table.shape[0])):
+        step = 2**k
+        extend = (left - step >= 0)
+        extend[extend] = maxima.table[k, left[extend] - step] <= heights[extend]
+        left[extend] -= step
+        extend = (right + step <= n)
+        extend[extend] = maxima.table[k, right[extend]] <= heights[extend]
+        right[extend] += step
+
+    # Peaks of each window, [first, last)
+    first = np.searchsorted(properties['left_edges'] - 1, starts)
+    last = np.searchsorted(properties['right_edges'] + 1, stops, side='left')
+    counts = np.maximum(last - first, 0)
+    windows = np.repeat(np.arange(len(starts)), counts)
+    members = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+    peak = peaks[members]
+    left_min = minima.query(np.maximum(left[members], starts[windows]), peak + 1)
+    right_min = minima.query(peak, np.minimum(right[members], stops[windows]))
+    prominences = heights[members] - np.maximum(left_min, right_min)
+    no_peaks = np.bincount(windows[prominences >= 0.05], minlength=len(starts))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _rolling_series(-no_peaks / distances, starts, window, fs, 'nop')
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts import their sibling modules by name, as when run from their own folders
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ['segmentation', 'smoothness']:
+    sys.path.append(os.path.join(root, folder))
@@ -0,0 +1,43 @@
+import pytest
+from linear_segmentation import LinearSegmentation
+from online_segmentation import OnlineLinearSegmenter
+from synthetic_traces import vr_session
+
+@pytest.mark.parametrize('window_size', [10, 20])
+def test_emission_delay(window_size):
+    df, _ = vr_session('controller', 2, seed=0)
+    segmenter = OnlineLinearSegmenter(window_size, 10**(-4))
+    emitted = []
+    for k, (x, y) in enumerate(zip(df['timeExp'], df['controller_speed_clean'])):
+        for breakpoint in segmenter.update(x, y):
+            # Breakpoint b is returned with sample b + window_size + 1
+            assert k == breakpoint + window_size + 1
+            emitted.append(breakpoint)
+    whole = LinearSegmentation('incremental').segment(df['timeExp'], df['controller_speed_clean'], window_size, 
+                                                      10**(-4))
+    assert len(emitted) > 0
+    assert emitted == whole['breakpoints']
+
+def test_bounded_state():
+    window_size = 10
+    df, _ = vr_session('controller', 10, seed=0)
+    segmenter = OnlineLinearSegmenter(window_size, 10**(-4))
+    emitted = []
+    for x, y in zip(df['timeExp'], df['controller_speed_clean']):
+        emitted += segmenter.update(x, y)
+        # Only the sample buffer is stored, however many segments are closed
+        assert len(segmenter.buffer) <= 2*window_size + 2
+        assert len(segmenter.segments) == 0
+    assert len(emitted) > 1000
+    assert len(segmenter.finish()) == 1
+
+def test_keep_segments():
+    df, _ = vr_session('controller', 2, seed=0)
+    segmenter = OnlineLinearSegmenter(10, 10**(-4), keep_segments=True)
+    emitted = segmenter.update_batch(df['timeExp'], df['controller_speed_clean'])
+    whole = LinearSegmentation('incremental').segment(df['timeExp'], df['controller_speed_clean'], 10, 10**(-4),
+                                                      return_models=True)
+    segments = segmenter.finish()
+    assert len(segments) == len(emitted) + 1
+    assert list(segments['start']) == list(whole['model_results']['start'])
+    assert list(segments['end']) == list(whole['model_results']['end'])
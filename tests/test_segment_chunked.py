@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from linear_segmentation import LinearSegmentation
+from synthetic_traces import vr_session
+
+@pytest.fixture(scope='module')
+def long_trace():
+    df, _ = vr_session('controller', 10, seed=0)
+    return df['timeExp'], df['controller_speed_clean']
+
+def test_chunked_matches_whole_block(long_trace):
+    x, y = long_trace
+    segmentation = LinearSegmentation('incremental')
+    whole = segmentation.segment(x, y, window_size=10, sig_level=10**(-4))
+    chunked = segmentation.segment_chunked(x, y, window_size=10, sig_level=10**(-4), chunk_size=5000, overlap=1000)
+    assert len(x) > 10*5000
+    assert chunked['unsynced_chunks'] == 0
+    assert chunked['breakpoints'] == whole['breakpoints']
+
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+def test_unsynced_chunks_are_counted():
+    # Noise has few breakpoints, so some overlaps have none in common
+    rng = np.random.default_rng(0)
+    x = pd.Series(np.arange(40000)/90)
+    y = pd.Series(rng.normal(0, 1, 40000))
+    segmentation = LinearSegmentation('incremental')
+    whole = segmentation.segment(x, y, window_size=10, sig_level=0.01)
+    chunked = segmentation.segment_chunked(x, y, window_size=10, sig_level=0.01, return_models=True, 
+                                           chunk_size=5000, overlap=1000)
+    assert chunked['breakpoints'] != whole['breakpoints']
+    assert chunked['unsynced_chunks'] == 9
+    scale = chunked['model_results']['scale']
+    assert np.all(np.isnan(scale) | (scale >= 0))